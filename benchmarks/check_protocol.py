@@ -0,0 +1,187 @@
+# Drives the plugin's RPC client against the stand-in COLT server and checks the protocol
+# extensions negotiated through getProtocolFeatures. Exits with 1 if a check fails.
+#
+#   python benchmarks/check_protocol.py
+import sys
+
+import run_benchmarks
+import mock_colt
+import sublime
+
+failures = []
+
+def check(name, condition):
+    print(("ok    " if condition else "FAIL  ") + name)
+    if not condition :
+        failures.append(name)
+
+def connect(rpc, config, projectPath):
+    server = mock_colt.MockColtServer(config).start()
+    connection = rpc.connectionManager.get(projectPath)
+    rpc.establishConnection(connection, server.port)
+    return (server, connection)
+
+# runs due UI callbacks until predicate() holds or timeout seconds pass
+def waitFor(predicate, timeout = 5):
+    return sublime.runPending(predicate, timeout)
+
+def checkContentDelta(rpc):
+    filePath = "/project/main.js"
+    (server, connection) = connect(rpc, mock_colt.MockColtConfig(features = [ "contentDelta" ]), "/project/delta.colt")
+
+    def query(text, changeCount):
+        content = rpc.BufferContent(text, changeCount)
+        del server.contentCalls[:]
+        response = rpc.runWithConnection(connection, rpc.getContextForPosition, filePath, 0, content, "PROPERTIES")
+        return (response, list(server.contentCalls))
+
+    try :
+        text = "var a = 1;\n" * 1000
+        (response, calls) = query(text, 1)
+        check("delta: first call sends the full text", calls == [ ("getContextForPosition", "full") ] and not "error" in response)
+
+        edited = text[:5000] + "b" + text[5000:]
+        (response, calls) = query(edited, 2)
+        check("delta: an edit sends a delta", calls == [ ("getContextForPosition", "delta") ] and not "error" in response)
+        check("delta: COLT rebuilds the edited text", server.contents[filePath] == edited)
+
+        (response, calls) = query(edited, 2)
+        check("delta: an unchanged buffer sends an empty delta", calls == [ ("getContextForPosition", "delta") ])
+        check("delta: COLT keeps the unchanged text", server.contents[filePath] == edited)
+
+        # COLT restarted and lost the file
+        server.contents.clear()
+        edited = edited + "var c;\n"
+        (response, calls) = query(edited, 3)
+        check("delta: a ContentMismatchException resends the full text",
+            calls == [ ("getContextForPosition", "mismatch"), ("getContextForPosition", "full") ] and not "error" in response)
+        check("delta: COLT has the text after the resend", server.contents[filePath] == edited)
+
+        (response, calls) = query(edited + "d", 4)
+        check("delta: deltas resume after the resend", calls == [ ("getContextForPosition", "delta") ])
+    finally :
+        server.stop()
+
+    (server, connection) = connect(rpc, mock_colt.MockColtConfig(), "/project/full.colt")
+    try :
+        rpc.runWithConnection(connection, rpc.getContextForPosition, filePath, 0, rpc.BufferContent("a", 1), "PROPERTIES")
+        rpc.runWithConnection(connection, rpc.getContextForPosition, filePath, 0, rpc.BufferContent("ab", 2), "PROPERTIES")
+        check("delta: without the feature every call sends the full text",
+            server.contentCalls == [ ("getContextForPosition", "full") ] * 2)
+    finally :
+        server.stop()
+
+def checkEventSubscription(rpc):
+    config = mock_colt.MockColtConfig(features = [ "eventSubscription" ])
+    (server, connection) = connect(rpc, config, "/project/events.colt")
+    subscription = connection.eventSubscription
+
+    received = []
+    def onSessions(event):
+        received.append((rpc.getConnection(), rpc.hasActiveSessions()))
+    rpc.ColtEventSubscription.addListener("sessions", onSessions)
+
+    try :
+        rpc.runWithConnection(connection, rpc.ensureEventSubscription)
+        check("events: the channel opens with the feature", waitFor(subscription.isActive))
+
+        server.pushEvent({ "type" : "sessions", "activeConnections" : [ { "id" : 1 }, { "id" : 2 } ] })
+        check("events: sessions are counted", waitFor(lambda: connection.activeSessions == 2))
+        check("events: listeners run with the event's connection", waitFor(lambda: received == [ (connection, True) ]))
+
+        polled = server.calls["getState"]
+        check("events: polling stands down while the channel is up",
+            rpc.runWithConnection(connection, rpc.coltStateUpdate) is False and server.calls["getState"] == polled)
+
+        server.pushEvent({ "type" : "sessions", "activeConnections" : [] })
+        check("events: the last session ending is seen", waitFor(lambda: connection.activeSessions == 0))
+
+        server.closeEvents()
+        check("events: the channel ends when COLT drops it", waitFor(lambda: not subscription.isActive()))
+
+        rpc.runWithConnection(connection, rpc.coltStateUpdate)
+        check("events: polling takes over after the channel ends",
+            server.calls["getState"] == polled + 1 and connection.activeSessions == 1)
+    finally :
+        rpc.runWithConnection(connection, rpc.disconnect)
+        server.stop()
+
+    (server, connection) = connect(rpc, mock_colt.MockColtConfig(), "/project/polling.colt")
+    try :
+        rpc.runWithConnection(connection, rpc.ensureEventSubscription)
+        check("events: no channel without the feature",
+            not connection.eventSubscription.isActive() and server.calls["waitForEvents"] == 0)
+
+        rpc.runWithConnection(connection, rpc.coltStateUpdate)
+        check("events: sessions are polled without the feature", server.calls["getState"] == 1 and connection.activeSessions == 1)
+    finally :
+        rpc.runWithConnection(connection, rpc.disconnect)
+        server.stop()
+
+def checkLogCursor(rpc):
+    (server, connection) = connect(rpc, mock_colt.MockColtConfig(features = [ "logCursor" ]), "/project/cursor.colt")
+
+    def refresh():
+        refreshState = rpc.runWithConnection(connection, rpc.getRefreshState)
+        messages = [ info["message"] for info in refreshState["logMessages"]["result"] ]
+        errors = [ info["errorMessage"] for info in refreshState["runtimeErrors"] ]
+        return (messages, errors)
+
+    runtimeError = { "position" : 10, "row" : 1, "filePath" : "/project/main.js" }
+    try :
+        server.logStream.add({ "position" : -1, "message" : "one" })
+        server.logStream.add({ "position" : -1, "message" : "two" })
+        server.runtimeErrorStream.add(dict(runtimeError, errorMessage = "boom"))
+        check("cursor: the first refresh gets everything", refresh() == ([ "one", "two" ], [ "boom" ]))
+        check("cursor: nothing new, nothing handed out", refresh() == ([], []))
+
+        server.logStream.add({ "position" : -1, "message" : "three" })
+        server.runtimeErrorStream.add(dict(runtimeError, errorMessage = "boom"))
+        check("cursor: only new entries, a repeated error included", refresh() == ([ "three" ], [ "boom" ]))
+
+        server.logStream.add({ "position" : -1, "message" : "four" })
+        server.logStream.drop(3)
+        server.logStream.add({ "position" : -1, "message" : "eight" })
+        check("cursor: dropped entries are noticed", refresh() == ([ "3 log messages were dropped by COLT", "four", "eight" ], []))
+
+        server.logStream.restart()
+        server.logStream.add({ "position" : -1, "message" : "again" })
+        check("cursor: a new epoch starts over", refresh() == ([ "COLT restarted, log messages start over", "again" ], []))
+        check("cursor: the cursor follows the new epoch", connection.logCursor.cursor == 1)
+
+        # the log call fails, so printLogs would drop the runtime error with it
+        server.runtimeErrorStream.add(dict(runtimeError, errorMessage = "lost?"))
+        def failLog(params):
+            raise mock_colt.MockColtError("log unavailable")
+        server.config.handlers["getLastLogMessages"] = failLog
+        errorCursor = connection.runtimeErrorCursor.cursor
+        check("cursor: nothing handed out while the log call fails", refresh() == ([], []))
+        check("cursor: the runtime error cursor stays put", connection.runtimeErrorCursor.cursor == errorCursor)
+
+        del server.config.handlers["getLastLogMessages"]
+        check("cursor: the held back runtime error comes next", refresh() == ([], [ "lost?" ]))
+    finally :
+        rpc.runWithConnection(connection, rpc.disconnect)
+        server.stop()
+
+    (server, connection) = connect(rpc, mock_colt.MockColtConfig(logMessages = 2), "/project/nocursor.colt")
+    try :
+        refreshState = rpc.runWithConnection(connection, rpc.getRefreshState)
+        check("cursor: without the feature the plain results come through",
+            len(refreshState["logMessages"]["result"]) == 2 and refreshState["runtimeErrors"] is None)
+    finally :
+        rpc.runWithConnection(connection, rpc.disconnect)
+        server.stop()
+
+def main():
+    rpc, plugin = run_benchmarks.loadPlugin()
+
+    checkContentDelta(rpc)
+    checkEventSubscription(rpc)
+    checkLogCursor(rpc)
+
+    print(str(len(failures)) + " failed" if failures else "all passed")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__" :
+    main()
@@ -0,0 +1,272 @@
+# Stand-in for COLT's /rpc/coltService JSON-RPC endpoint, with configurable latency and payload sizes
+import collections
+import hashlib
+import http.server
+import json
+import socketserver
+import threading
+import time
+
+class MockColtConfig(object):
+    def __init__(self, latency = 0.0, properties = 50, logMessages = 5, counts = 200, files = None, features = None):
+        # seconds added to every request (a batch counts once)
+        self.latency = latency
+        self.properties = properties
+        self.logMessages = logMessages
+        self.counts = counts
+        self.files = files or [ "/project/main.js" ]
+        self.features = features or []
+        # method name -> func(params) returning a result, consulted first
+        self.handlers = {}
+
+# method name -> index of the buffer content in its params
+contentParams = {
+    "reloadScriptAt" : 3,
+    "getDeclarationPosition" : 3,
+    "getContextForPosition" : 3,
+    "evaluateExpression" : 4,
+    "getCallCount" : 3,
+    "getEnclosingTagId" : 3,
+    "findAndShowJavaDocs" : 3,
+    "angularDirectiveDeclaration" : 3,
+    "getMethodId" : 3
+}
+
+def contentHash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+# answered as a JSON-RPC error carrying the Java exception type, like COLT does
+class MockColtError(Exception):
+    exceptionTypeName = "java.lang.RuntimeException"
+
+class ContentMismatch(MockColtError):
+    exceptionTypeName = "codeOrchestra.colt.core.rpc.ContentMismatchException"
+
+# method name -> the protocol feature that has to be enabled for it
+featureMethods = {
+    "waitForEvents" : "eventSubscription"
+}
+
+# a numbered stream as COLT keeps it for the "logCursor" feature; numbers start over with each epoch
+class MockColtStream(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.epoch = 1
+        self.seq = 0
+        self.entries = []
+
+    def add(self, entry):
+        with self.lock :
+            self.seq += 1
+            entry = dict(entry)
+            entry["seq"] = self.seq
+            self.entries.append(entry)
+
+    # numbers move on as if count entries had been logged, but they are gone
+    def drop(self, count):
+        with self.lock :
+            self.seq += count
+
+    def restart(self):
+        with self.lock :
+            self.epoch += 1
+            self.seq = 0
+            self.entries = []
+
+    # a cursor beyond the last number is from an earlier epoch and gets everything
+    def read(self, cursor):
+        with self.lock :
+            if cursor is None or cursor > self.seq :
+                entries = list(self.entries)
+            else :
+                entries = [ entry for entry in self.entries if entry["seq"] > cursor ]
+            return { "epoch" : self.epoch, "cursor" : self.seq, "entries" : entries }
+
+class MockColtHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out as separate writes; keep Nagle from adding a delayed-ACK wait to each reply
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        request = json.loads(self.rfile.read(length).decode("utf-8"))
+
+        latency = self.server.getLatency(request)
+        if latency > 0 :
+            time.sleep(latency)
+
+        if isinstance(request, list) :
+            response = [ self.server.answer(item) for item in request ]
+        else :
+            response = self.server.answer(request)
+
+        data = json.dumps(response).encode("utf-8")
+        self.server.requests += 1
+        self.server.bytesIn += length
+        self.server.bytesOut += len(data)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class MockColtServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config):
+        http.server.HTTPServer.__init__(self, ("localhost", 0), MockColtHandler)
+        self.config = config
+        self.requests = 0
+        self.bytesIn = 0
+        self.bytesOut = 0
+        self.thread = None
+        self.contentLock = threading.Lock()
+        # file path -> the content last received, as COLT keeps it for deltas
+        self.contents = {}
+        # (method, "full" or "delta" or "mismatch") per content-carrying call
+        self.contentCalls = []
+        self.callsLock = threading.Lock()
+        # method name -> calls answered
+        self.calls = collections.Counter()
+        # events for waitForEvents; the cursor is the number of events already delivered
+        self.eventCondition = threading.Condition()
+        self.events = []
+        self.eventsOpen = True
+        self.logStream = MockColtStream()
+        self.runtimeErrorStream = MockColtStream()
+
+    @property
+    def port(self):
+        return str(self.server_address[1])
+
+    def start(self):
+        self.thread = threading.Thread(target = self.serve_forever, name = "mock COLT")
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.closeEvents()
+        self.shutdown()
+        self.server_close()
+
+    # seconds to wait before answering a request or a whole batch
+    def getLatency(self, request):
+        return self.config.latency
+
+    def answer(self, request):
+        method = request.get("method")
+        params = request.get("params")
+
+        handler = self.config.handlers.get(method)
+        if handler is None :
+            handler = getattr(self, "on_" + str(method), None)
+
+        if handler is None or (method in featureMethods and not featureMethods[method] in self.config.features) :
+            return { "jsonrpc" : "2.0", "id" : request.get("id"), "error" : { "code" : -32601, "message" : "Method not found" } }
+
+        with self.callsLock :
+            self.calls[method] += 1
+
+        try :
+            if method in contentParams and isinstance(params, list) and len(params) > contentParams[method] :
+                params = list(params)
+                params[contentParams[method]] = self.receiveContent(method, params[1], params[contentParams[method]])
+
+            return { "jsonrpc" : "2.0", "id" : request.get("id"), "result" : handler(params) }
+        except MockColtError as e :
+            return { "jsonrpc" : "2.0", "id" : request.get("id"), "error" : { "code" : -32000, "message" : str(e),
+                "data" : { "exceptionTypeName" : e.exceptionTypeName } } }
+
+    # full text, or with the "contentDelta" feature a delta against the content received last
+    def receiveContent(self, method, filePath, content):
+        with self.contentLock :
+            if not isinstance(content, dict) :
+                self.contents[filePath] = content
+                self.contentCalls.append((method, "full"))
+                return content
+
+            if not "contentDelta" in self.config.features :
+                raise ContentMismatch("content deltas are not supported")
+
+            base = self.contents.get(filePath)
+            if base is None or contentHash(base) != content["baseHash"] :
+                self.contentCalls.append((method, "mismatch"))
+                raise ContentMismatch("no content with hash " + content["baseHash"] + " for " + filePath)
+
+            text = base[:content["start"]] + content["text"] + base[content["end"]:]
+            if contentHash(text) != content["hash"] :
+                self.contentCalls.append((method, "mismatch"))
+                raise ContentMismatch("delta for " + filePath + " does not produce hash " + content["hash"])
+
+            self.contents[filePath] = text
+            self.contentCalls.append((method, "delta"))
+            return text
+
+    def pushEvent(self, event):
+        with self.eventCondition :
+            self.events.append(event)
+            self.eventCondition.notify_all()
+
+    # pending and later waitForEvents calls fail, as when COLT shuts the channel down
+    def closeEvents(self):
+        with self.eventCondition :
+            self.eventsOpen = False
+            self.eventCondition.notify_all()
+
+    # params are [ securityToken, cursor, timeout in ms ]
+    def on_waitForEvents(self, params):
+        cursor = params[1] or 0
+        deadline = time.time() + params[2] / 1000.0
+        with self.eventCondition :
+            while self.eventsOpen and len(self.events) <= cursor and time.time() < deadline :
+                self.eventCondition.wait(deadline - time.time())
+
+            if not self.eventsOpen :
+                raise MockColtError("event channel closed")
+
+            return { "cursor" : len(self.events), "events" : self.events[cursor:] }
+
+    def on_ping(self, params):
+        return None
+
+    def on_getProtocolFeatures(self, params):
+        return self.config.features
+
+    def on_getState(self, params):
+        return { "activeConnections" : [ { "id" : 1 } ] }
+
+    def makeProperties(self):
+        return json.dumps([ "property" + str(i) for i in range(self.config.properties) ] + [ "method(a, b)" ])
+
+    def on_getContextForPosition(self, params):
+        return self.makeProperties()
+
+    def on_evaluateExpression(self, params):
+        return self.makeProperties()
+
+    # params are [ securityToken ], plus the last seen number with the "logCursor" feature
+    def on_getLastLogMessages(self, params):
+        if "logCursor" in self.config.features and len(params) > 1 :
+            return self.logStream.read(params[1])
+        return [ { "position" : -1, "message" : "log message " + str(i) } for i in range(self.config.logMessages) ]
+
+    def on_getLastRuntimeError(self, params):
+        if "logCursor" in self.config.features and len(params) > 1 :
+            return self.runtimeErrorStream.read(params[1])
+        return None
+
+    def on_getMethodCounts(self, params):
+        files = self.config.files
+        return [ { "filePath" : files[i % len(files)], "position" : (i // len(files)) * 40, "count" : 1 + i % 12 }
+            for i in range(self.config.counts) ]
+
+    def on_getDeclarationPosition(self, params):
+        return { "filePath" : self.config.files[0], "optionalRow" : 1 }
+
+    def on_reloadScriptAt(self, params):
+        return None
@@ -0,0 +1,168 @@
+# Replays a session recorded with "COLT: Start/Stop Recording RPC" through the plugin's RPC client
+# against a stand-in server that answers with the recorded responses, and reports latencies per
+# trigger and per method next to the recorded ones.
+#
+#   python benchmarks/replay_session.py /tmp/colt-session-20260101-120000.jsonl.gz --speed 4
+import argparse
+import collections
+import concurrent.futures
+import gzip
+import json
+import threading
+import time
+
+import run_benchmarks
+import mock_colt
+
+def loadRecording(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding = "utf-8") as recording :
+        lines = [ json.loads(line) for line in recording if line.strip() ]
+
+    header = lines[0]
+    if header.get("version") != 1 :
+        raise ValueError("unsupported recording version " + str(header.get("version")))
+
+    return lines[1:]
+
+def getCallKey(request):
+    return request.get("method") + ":" + json.dumps(request.get("params"), sort_keys = True)
+
+def getStatsName(request):
+    if isinstance(request, list) :
+        return "batch:" + "+".join(item["method"] for item in request)
+    return request["method"]
+
+# answers each call with what COLT answered for the same method and params, in recorded order
+class ReplayServer(mock_colt.MockColtServer):
+    def __init__(self, calls, serverTime):
+        mock_colt.MockColtServer.__init__(self, mock_colt.MockColtConfig())
+        self.lock = threading.Lock()
+        self.answers = collections.defaultdict(collections.deque)
+        self.answersByMethod = collections.defaultdict(collections.deque)
+        self.latencies = collections.defaultdict(collections.deque)
+
+        for call in calls :
+            request = call["request"]
+            response = call["response"]
+            if serverTime :
+                self.latencies[json.dumps(self.stripIds(request), sort_keys = True)].append(call["ms"] / 1000.0)
+            if response is None :
+                continue
+
+            items = request if isinstance(request, list) else [ request ]
+            responses = response if isinstance(response, list) else [ response ]
+            responsesById = dict((item.get("id"), item) for item in responses)
+            for item in items :
+                answer = responsesById.get(item.get("id"))
+                if not answer is None :
+                    self.answers[getCallKey(item)].append(answer)
+                    self.answersByMethod[item["method"]].append(answer)
+
+    def stripIds(self, request):
+        if isinstance(request, list) :
+            return [ self.stripIds(item) for item in request ]
+        return { "method" : request.get("method"), "params" : request.get("params") }
+
+    def getLatency(self, request):
+        with self.lock :
+            latencies = self.latencies.get(json.dumps(self.stripIds(request), sort_keys = True))
+            if latencies :
+                latencies.rotate(-1)
+                return latencies[-1]
+        return 0.0
+
+    def answer(self, request):
+        with self.lock :
+            answers = self.answers.get(getCallKey(request)) or self.answersByMethod.get(request.get("method"))
+            if not answers :
+                return mock_colt.MockColtServer.answer(self, request)
+
+            # calls repeat in a replay of a replay; keep cycling through the recorded answers
+            answers.rotate(-1)
+            answer = dict(answers[-1])
+
+        answer["id"] = request.get("id")
+        return answer
+
+def replay(rpc, calls, server, options):
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers = options.workers)
+    lock = threading.Lock()
+    latencies = []
+
+    def send(call):
+        request = call["request"]
+        if isinstance(request, list) :
+            fresh = [ rpc.makeRequest(item["method"], item.get("params")) for item in request ]
+        else :
+            fresh = rpc.makeRequest(request["method"], request.get("params"))
+
+        rpc.rpcContext.trigger = call["trigger"]
+        startTime = time.perf_counter()
+        try :
+            rpc.postJSON(server.port, fresh)
+        except Exception as e :
+            print("replay: " + getStatsName(request) + " failed: " + str(e))
+        duration = time.perf_counter() - startTime
+
+        with lock :
+            latencies.append((call["trigger"], getStatsName(request), duration))
+
+    startTime = time.perf_counter()
+    futures = []
+    for call in calls :
+        if options.speed > 0 :
+            delay = startTime + call["t"] / options.speed - time.perf_counter()
+            if delay > 0 :
+                time.sleep(delay)
+            futures.append(executor.submit(send, call))
+        else :
+            send(call)
+
+    concurrent.futures.wait(futures)
+    executor.shutdown()
+    return latencies
+
+def summarizeGroups(prefix, samples):
+    groups = collections.defaultdict(list)
+    for name, duration in samples :
+        groups[name].append(duration)
+    return [ run_benchmarks.summarize(prefix + name, groups[name]) for name in sorted(groups) ]
+
+def main():
+    parser = argparse.ArgumentParser(description = "Replay a recorded COLT session against a stand-in server")
+    parser.add_argument("recording")
+    parser.add_argument("--speed", type = float, default = 1.0, help = "time compression, 0 sends calls back to back")
+    parser.add_argument("--server-time", choices = [ "recorded", "none" ], default = "recorded",
+        help = "whether the stand-in server waits out each recorded round-trip before answering")
+    parser.add_argument("--workers", type = int, default = 4, help = "concurrent calls, like the plugin's RPC pool")
+    parser.add_argument("--label", default = "")
+    parser.add_argument("--format", choices = [ "json", "csv" ], default = "json")
+    parser.add_argument("--output", default = "")
+    options = parser.parse_args()
+
+    calls = loadRecording(options.recording)
+    if len(calls) == 0 :
+        raise SystemExit("the recording has no calls")
+
+    rpc, plugin = run_benchmarks.loadPlugin()
+
+    server = ReplayServer(calls, options.server_time == "recorded").start()
+    rpc.establishConnection(rpc.connectionManager.get("/project/replay.colt"), server.port)
+    try :
+        latencies = replay(rpc, calls, server, options)
+    finally :
+        server.stop()
+
+    recorded = [ (call["trigger"], getStatsName(call["request"]), call["ms"] / 1000.0) for call in calls ]
+
+    results = []
+    results.extend(summarizeGroups("replay.trigger.", [ (trigger, duration) for trigger, name, duration in latencies ]))
+    results.extend(summarizeGroups("replay.method.", [ (name, duration) for trigger, name, duration in latencies ]))
+    results.extend(summarizeGroups("recorded.trigger.", [ (trigger, duration) for trigger, name, duration in recorded ]))
+    results.extend(summarizeGroups("recorded.method.", [ (name, duration) for trigger, name, duration in recorded ]))
+
+    run_benchmarks.writeResults(results, options)
+
+if __name__ == "__main__" :
+    main()
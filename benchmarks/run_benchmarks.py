@@ -0,0 +1,194 @@
+# Headless performance benchmarks for the COLT plugin: a stub Sublime API, a mock COLT server,
+# and timings for the RPC round-trip, completions, the idle refresh and count marker rendering.
+#
+#   python benchmarks/run_benchmarks.py --latency 2 --counts 5000 --format csv --output bench.csv
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import types
+
+benchmarksDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmarksDir, "stubs"))
+sys.path.insert(0, benchmarksDir)
+
+import sublime
+import mock_colt
+
+fields = [ "benchmark", "samples", "min", "mean", "p50", "p95", "p99", "max" ]
+
+# the plugin imports itself as the COLT package, as it does inside Sublime's Packages folder
+def loadPlugin():
+    package = types.ModuleType("COLT")
+    package.__path__ = [ os.path.dirname(benchmarksDir) ]
+    sys.modules["COLT"] = package
+
+    import COLT.colt_rpc, COLT.run_with_colt
+    return COLT.colt_rpc, COLT.run_with_colt
+
+def percentile(samples, q):
+    return samples[min(len(samples) - 1, int(round(q * (len(samples) - 1))))]
+
+# samples in seconds, reported in milliseconds
+def summarize(name, samples):
+    samples = sorted(sample * 1000.0 for sample in samples)
+    return {
+        "benchmark" : name,
+        "samples" : len(samples),
+        "min" : round(samples[0], 4),
+        "mean" : round(sum(samples) / len(samples), 4),
+        "p50" : round(percentile(samples, 0.50), 4),
+        "p95" : round(percentile(samples, 0.95), 4),
+        "p99" : round(percentile(samples, 0.99), 4),
+        "max" : round(samples[-1], 4) }
+
+def timed(func):
+    startTime = time.perf_counter()
+    func()
+    return time.perf_counter() - startTime
+
+def benchRPC(rpc, server, options):
+    samples = [ timed(lambda: rpc.runRPC(server.port, "ping", None)) for i in range(options.iterations) ]
+    return [ summarize("rpc.ping", samples) ]
+
+def benchCompletions(rpc, plugin, options):
+    window = sublime.Window()
+    text = "var value = { a : 1 };\n" * options.lines + "value."
+    view = window.add_view(sublime.View("/project/main.js", text))
+    completions = plugin.ColtCompletitions()
+
+    def popupShown():
+        return any(command[0] == "auto_complete" for command in view.commands)
+
+    blocking = []
+    roundTrip = []
+    for i in range(options.iterations) :
+        # a new live state makes every query miss the cache
+        rpc.liveStateChanged()
+        view.commands = []
+
+        startTime = time.perf_counter()
+        completions.on_query_completions(view, "", [ len(text) ])
+        blocking.append(time.perf_counter() - startTime)
+
+        sublime.runPending(popupShown, 10)
+        roundTrip.append(time.perf_counter() - startTime)
+
+    cached = [ timed(lambda: completions.on_query_completions(view, "pro", [ len(text) ])) for i in range(options.iterations) ]
+
+    return [
+        summarize("completions.query_blocking", blocking),
+        summarize("completions.until_popup", roundTrip),
+        summarize("completions.cached", cached) ]
+
+def benchIdle(rpc, plugin, options):
+    window = sublime.Window()
+    window.add_view(sublime.View("/project/main.js", "x\n" * options.lines))
+
+    fetch = []
+    apply = []
+    for i in range(options.iterations) :
+        fetch.append(timed(plugin.IdleWatcher.refresh))
+        apply.append(timed(lambda: sublime.runPending(timeout = 0)))
+
+    return [ summarize("idle.refresh_fetch", fetch), summarize("idle.refresh_apply", apply) ]
+
+def benchCounts(rpc, plugin, options):
+    files = [ "/project/file" + str(i) + ".js" for i in range(options.views) ]
+    countsPerFile = options.counts // len(files) + 1
+    # 40 characters per line, one counted function every line
+    text = ("x" * 39 + "\n") * countsPerFile
+
+    window = sublime.Window()
+    for filePath in files :
+        window.add_view(sublime.View(filePath, text))
+
+    counts = [ { "filePath" : files[i % len(files)], "position" : (i // len(files)) * 40, "count" : 1 + i % 12 }
+        for i in range(options.counts) ]
+    changedCounts = [ dict(info, count = info["count"] + 1) for info in counts ]
+
+    markers = plugin.GetAllCountsCommand
+    first = []
+    steady = []
+    changed = []
+    for i in range(options.iterations) :
+        markers.markers.clear()
+        first.append(timed(lambda: markers.showCounts({ "result" : counts })))
+        steady.append(timed(lambda: markers.showCounts({ "result" : counts })))
+        changed.append(timed(lambda: markers.showCounts({ "result" : changedCounts })))
+
+    suffix = "[" + str(options.views) + "x" + str(options.counts) + "]"
+    return [
+        summarize("counts.first_render" + suffix, first),
+        summarize("counts.unchanged" + suffix, steady),
+        summarize("counts.all_changed" + suffix, changed) ]
+
+def writeResults(results, options):
+    output = sys.stdout
+    if options.output :
+        output = open(options.output, "w", newline = "")
+
+    try :
+        if options.format == "csv" :
+            writer = csv.DictWriter(output, [ "label" ] + fields)
+            writer.writeheader()
+            for result in results :
+                writer.writerow(dict(result, label = options.label))
+        else :
+            json.dump({ "label" : options.label, "options" : vars(options), "results" : results }, output, indent = 2)
+            output.write("\n")
+    finally :
+        if output != sys.stdout :
+            output.close()
+
+def main():
+    parser = argparse.ArgumentParser(description = "Headless COLT plugin benchmarks")
+    parser.add_argument("--iterations", type = int, default = 100)
+    parser.add_argument("--latency", type = float, default = 0.0, help = "mock COLT latency per request, ms")
+    parser.add_argument("--properties", type = int, default = 50, help = "completion list size")
+    parser.add_argument("--lines", type = int, default = 5000, help = "lines in the edited buffer")
+    parser.add_argument("--log-messages", type = int, default = 5, help = "log messages per refresh")
+    parser.add_argument("--views", type = int, default = 10, help = "open views for count rendering")
+    parser.add_argument("--counts", type = int, default = 2000, help = "method counts for count rendering")
+    parser.add_argument("--features", default = "", help = "comma separated protocol features the mock COLT offers")
+    parser.add_argument("--only", default = "", help = "comma separated subset of rpc, completions, idle, counts")
+    parser.add_argument("--label", default = "", help = "tag stored with the results, e.g. a plugin version")
+    parser.add_argument("--format", choices = [ "json", "csv" ], default = "json")
+    parser.add_argument("--output", default = "")
+    options = parser.parse_args()
+
+    rpc, plugin = loadPlugin()
+
+    config = mock_colt.MockColtConfig(
+        latency = options.latency / 1000.0,
+        properties = options.properties,
+        logMessages = options.log_messages,
+        counts = options.counts,
+        features = [ feature for feature in options.features.split(",") if feature ])
+    server = mock_colt.MockColtServer(config).start()
+
+    rpc.establishConnection(rpc.connectionManager.get("/project/benchmark.colt"), server.port)
+    rpc.setActiveSessions(1)
+
+    benchmarks = [
+        ("rpc", lambda: benchRPC(rpc, server, options)),
+        ("completions", lambda: benchCompletions(rpc, plugin, options)),
+        ("idle", lambda: benchIdle(rpc, plugin, options)),
+        ("counts", lambda: benchCounts(rpc, plugin, options)) ]
+
+    only = [ name for name in options.only.split(",") if name ]
+
+    results = []
+    try :
+        for name, benchmark in benchmarks :
+            if len(only) == 0 or name in only :
+                results.extend(benchmark())
+    finally :
+        server.stop()
+
+    writeResults(results, options)
+
+if __name__ == "__main__" :
+    main()
@@ -0,0 +1,297 @@
+# Minimal stand-in for the Sublime Text API, enough to drive the plugin headless.
+# set_timeout callbacks are queued and run by runPending() on the calling ("UI") thread.
+import heapq
+import itertools
+import re
+import threading
+import time
+
+HIDDEN = 128
+ENCODED_POSITION = 1
+INHIBIT_WORD_COMPLETIONS = 8
+INHIBIT_EXPLICIT_COMPLETIONS = 16
+
+timeoutLock = threading.Lock()
+timeouts = []
+timeoutOrder = itertools.count()
+viewIds = itertools.count(1)
+
+settingsByName = {}
+windowList = []
+
+class Region(object):
+    def __init__(self, a, b = None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return self.end() - self.begin()
+
+    def empty(self):
+        return self.a == self.b
+
+    def __repr__(self):
+        return "Region(" + str(self.a) + ", " + str(self.b) + ")"
+
+class Settings(object):
+    def __init__(self):
+        self.values = {}
+        self.listeners = {}
+
+    def get(self, key, default = None):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+        for listener in list(self.listeners.values()) :
+            listener()
+
+    def has(self, key):
+        return key in self.values
+
+    def erase(self, key):
+        self.values.pop(key, None)
+
+    def add_on_change(self, tag, listener):
+        self.listeners[tag] = listener
+
+    def clear_on_change(self, tag):
+        self.listeners.pop(tag, None)
+
+class View(object):
+    def __init__(self, fileName = None, text = "", window = None):
+        self.viewId = next(viewIds)
+        self.fileName = fileName
+        self.text = text
+        self.parentWindow = window
+        self.selection = [ Region(len(text)) ]
+        self.regions = {}
+        self.statuses = {}
+        self.changeCount = 0
+        self.commands = []
+        self.readOnly = False
+        self.dirty = False
+
+    def id(self):
+        return self.viewId
+
+    def file_name(self):
+        return self.fileName
+
+    def window(self):
+        return self.parentWindow
+
+    def size(self):
+        return len(self.text)
+
+    def change_count(self):
+        return self.changeCount
+
+    def is_dirty(self):
+        return self.dirty
+
+    def is_valid(self):
+        return not self.parentWindow is None
+
+    def sel(self):
+        return self.selection
+
+    def substr(self, x):
+        if isinstance(x, Region) :
+            return self.text[x.begin():x.end()]
+        return self.text[x:x + 1]
+
+    def rowcol(self, point):
+        row = self.text.count("\n", 0, point)
+        return (row, point - (self.text.rfind("\n", 0, point) + 1))
+
+    def text_point(self, row, col):
+        point = 0
+        for i in range(row) :
+            point = self.text.index("\n", point) + 1
+        return point + col
+
+    def line(self, x):
+        point = x.begin() if isinstance(x, Region) else x
+        start = self.text.rfind("\n", 0, point) + 1
+        end = self.text.find("\n", point)
+        if end == -1 :
+            end = len(self.text)
+        return Region(start, end)
+
+    def word(self, x):
+        point = x.begin() if isinstance(x, Region) else x
+        start = point
+        while start > 0 and re.match("\\w", self.text[start - 1]) :
+            start -= 1
+        end = point
+        while end < len(self.text) and re.match("\\w", self.text[end]) :
+            end += 1
+        return Region(start, end)
+
+    def visible_region(self):
+        return Region(0, min(len(self.text), 4000))
+
+    def insert(self, edit, point, text):
+        self.text = self.text[:point] + text + self.text[point:]
+        self.changeCount += 1
+        return len(text)
+
+    def erase(self, edit, region):
+        self.text = self.text[:region.begin()] + self.text[region.end():]
+        self.changeCount += 1
+
+    def replace(self, edit, region, text):
+        self.text = self.text[:region.begin()] + text + self.text[region.end():]
+        self.changeCount += 1
+
+    def add_regions(self, key, regions, scope = "", icon = "", flags = 0):
+        self.regions[key] = list(regions)
+
+    def erase_regions(self, key):
+        self.regions.pop(key, None)
+
+    def get_regions(self, key):
+        return self.regions.get(key, [])
+
+    def set_status(self, key, value):
+        self.statuses[key] = value
+
+    def erase_status(self, key):
+        self.statuses.pop(key, None)
+
+    def set_scratch(self, scratch):
+        pass
+
+    def set_read_only(self, readOnly):
+        self.readOnly = readOnly
+
+    def set_name(self, name):
+        pass
+
+    def show(self, x):
+        pass
+
+    def run_command(self, name, args = None):
+        self.commands.append((name, args))
+        import sublime_plugin
+        commandClass = sublime_plugin.findCommand(name, sublime_plugin.TextCommand)
+        if not commandClass is None :
+            commandClass(self).run(None, **(args or {}))
+
+class Window(object):
+    def __init__(self):
+        self.viewList = []
+        self.panels = {}
+        self.commands = []
+        windowList.append(self)
+
+    def id(self):
+        return id(self)
+
+    def views(self):
+        return list(self.viewList)
+
+    def active_view(self):
+        if len(self.viewList) == 0 :
+            return None
+        return self.viewList[0]
+
+    def open_file(self, fileName, flags = 0):
+        view = View(fileName, "", self)
+        self.viewList.append(view)
+        return view
+
+    def add_view(self, view):
+        view.parentWindow = self
+        self.viewList.append(view)
+        return view
+
+    def folders(self):
+        return []
+
+    def find_output_panel(self, name):
+        return self.panels.get(name)
+
+    def create_output_panel(self, name):
+        panel = View(None, "", self)
+        self.panels[name] = panel
+        return panel
+
+    get_output_panel = create_output_panel
+
+    def run_command(self, name, args = None):
+        self.commands.append((name, args))
+
+    def show_quick_panel(self, items, onDone, *args):
+        pass
+
+    def show_input_panel(self, *args):
+        pass
+
+    def set_view_index(self, *args):
+        pass
+
+def load_settings(name):
+    return settingsByName.setdefault(name, Settings())
+
+def save_settings(name):
+    pass
+
+def set_timeout(callback, delay = 0):
+    with timeoutLock :
+        heapq.heappush(timeouts, (time.time() + delay / 1000.0, next(timeoutOrder), callback))
+
+set_timeout_async = set_timeout
+
+# runs due callbacks until predicate() holds or timeout seconds pass; returns predicate()
+def runPending(predicate = None, timeout = 0):
+    deadline = time.time() + timeout
+    while True :
+        callback = None
+        with timeoutLock :
+            if len(timeouts) > 0 and timeouts[0][0] <= time.time() :
+                callback = heapq.heappop(timeouts)[2]
+
+        if not callback is None :
+            callback()
+            continue
+
+        if not predicate is None and predicate() :
+            return True
+        if time.time() >= deadline :
+            return predicate is None or predicate()
+        time.sleep(0.0005)
+
+# like Sublime, a new window takes the focus
+def active_window():
+    if len(windowList) == 0 :
+        return Window()
+    return windowList[-1]
+
+def windows():
+    return list(windowList)
+
+def status_message(message):
+    pass
+
+def error_message(message):
+    print("error: " + message)
+
+def message_dialog(message):
+    pass
+
+def platform():
+    return "linux"
+
+def packages_path():
+    return "."
+
+def version():
+    return "3211"
@@ -0,0 +1,35 @@
+# Minimal stand-in for sublime_plugin: command base classes plus lookup by command name
+import re
+
+commandClasses = []
+
+def commandName(commandClass):
+    name = commandClass.__name__
+    if name.endswith("Command") :
+        name = name[:-len("Command")]
+    return re.sub("([a-z0-9])([A-Z])", "\\1_\\2", name).lower()
+
+def findCommand(name, baseClass):
+    for commandClass in reversed(commandClasses) :
+        if issubclass(commandClass, baseClass) and commandName(commandClass) == name :
+            return commandClass
+    return None
+
+class Command(object):
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        commandClasses.append(cls)
+
+class ApplicationCommand(Command):
+    pass
+
+class WindowCommand(Command):
+    def __init__(self, window):
+        self.window = window
+
+class TextCommand(Command):
+    def __init__(self, view):
+        self.view = view
+
+class EventListener(object):
+    pass
@@ -1,5 +1,7 @@
-import os.path
+import os, os.path
 import subprocess
+import tempfile
+import threading
 import sublime
 
 from xml.etree.ElementTree import Element, SubElement, tostring, parse
@@ -7,6 +9,78 @@ from xml.etree.ElementTree import Element, SubElement, tostring, parse
 class ColtPreferences(object):
         NAME = "Preferences.sublime-settings"
 
+# the COLT settings as plain attributes (coltSettings.autosave, coltSettings.securityToken, ...),
+# loaded once and refreshed when the preferences change, so keystroke and RPC paths do not go
+# through load_settings. Until load() runs every attribute holds its default
+class ColtSettings(object):
+        # setting name -> default
+        defaults = {
+                "coltPath" : None,
+                "coltBrowserPath" : None,
+                "securityToken" : None,
+                "autosave" : False,
+                "autosaveDelay" : 300,
+                "autosaveMaxLatency" : 2000,
+                "autosaveLivePush" : False,
+                "completionDeadline" : 1500,
+                "completionPrefetch" : True,
+                "declarationPrefetch" : False,
+                "logCapacity" : 5000,
+                "statePollInterval" : 800,
+                "refreshInterval" : 800,
+                "rpcTraceFile" : None
+        }
+
+        def __init__(self):
+                self.settings = None
+                # tag -> func(), called after every refresh
+                self.listeners = {}
+                for name, default in ColtSettings.defaults.items() :
+                        setattr(self, name, default)
+
+        def load(self):
+                if not self.settings is None :
+                        return
+
+                self.settings = sublime.load_settings(ColtPreferences.NAME)
+                self.settings.add_on_change("colt-settings", self.refresh)
+                self.refresh()
+
+        def unload(self):
+                if not self.settings is None :
+                        self.settings.clear_on_change("colt-settings")
+                        self.settings = None
+
+        def refresh(self):
+                for name, default in ColtSettings.defaults.items() :
+                        setattr(self, name, self.settings.get(name, default))
+
+                for listener in list(self.listeners.values()) :
+                        listener()
+
+        # listener also runs right away, with the current values
+        def addListener(self, tag, listener):
+                self.listeners[tag] = listener
+                listener()
+
+        def removeListener(self, tag):
+                self.listeners.pop(tag, None)
+
+        # stores a setting in the user preferences
+        def set(self, name, value):
+                self.load()
+                self.settings.set(name, value)
+                sublime.save_settings(ColtPreferences.NAME)
+                setattr(self, name, value)
+
+coltSettings = ColtSettings()
+
+def plugin_loaded():
+        coltSettings.load()
+
+def plugin_unloaded():
+        coltSettings.unload()
+
 def isColtFile(view):
         if view.file_name() is None :
                 return False
@@ -14,42 +88,112 @@ def isColtFile(view):
         filename = view.file_name().lower()
         return filename.endswith(".js") or filename.endswith(".htm") or filename.endswith(".html")
 
-def getProjectWorkingDir(projectPath): 
-        storageFilePath = os.path.expanduser("~") + os.sep + ".colt" + os.sep + "storage.xml"
-
-        if not os.path.exists(storageFilePath) :
-                return None
+def getColtDir():
+        return os.path.expanduser("~") + os.sep + ".colt"
+
+# in-memory view of ~/.colt/storage.xml and workingset.xml; a file is parsed again only
+# when its mtime or size changes
+class ColtStorageIndex(object):
+        def __init__(self):
+                self.lock = threading.Lock()
+                self.stamps = {}
+                self.values = {}
+
+        def getStamp(self, filePath):
+                try :
+                        stat = os.stat(filePath)
+                except OSError :
+                        return None
+
+                return (stat.st_mtime_ns, stat.st_size)
+
+        def get(self, filePath, parseFunc, default):
+                stamp = self.getStamp(filePath)
+                if stamp is None :
+                        return default
+
+                with self.lock :
+                        if self.stamps.get(filePath) == stamp :
+                                return self.values[filePath]
+
+                value = parseFunc(filePath)
+
+                with self.lock :
+                        self.stamps[filePath] = stamp
+                        self.values[filePath] = value
+
+                return value
+
+        # write through a temporary file so COLT never reads a half-written file
+        def write(self, filePath, text, value):
+                fileDescriptor, tempFilePath = tempfile.mkstemp(dir = os.path.dirname(filePath), prefix = ".colt")
+                try :
+                        # mkstemp creates the file private; keep the permissions a plain open() would give
+                        try :
+                                mode = os.stat(filePath).st_mode & 0o777
+                        except OSError :
+                                umask = os.umask(0)
+                                os.umask(umask)
+                                mode = 0o666 & ~umask
+                        os.chmod(tempFilePath, mode)
+
+                        with os.fdopen(fileDescriptor, "w") as tempFile :
+                                tempFile.write(text)
+                        os.replace(tempFilePath, filePath)
+                except Exception :
+                        if os.path.exists(tempFilePath) :
+                                os.remove(tempFilePath)
+                        raise
+
+                stamp = self.getStamp(filePath)
+                with self.lock :
+                        self.stamps[filePath] = stamp
+                        self.values[filePath] = value
+
+storageIndex = ColtStorageIndex()
+
+def parseStorage(storageFilePath):
+        projectSubDirs = {}
+        for storageElement in parse(storageFilePath).getroot() :
+                projectPath = storageElement.attrib["path"]
+                # first entry wins, as with the former linear scan
+                if not projectPath in projectSubDirs :
+                        projectSubDirs[projectPath] = storageElement.attrib["subDir"]
+        return projectSubDirs
+
+def parseWorkingSet(workingSetFilePath):
+        projectsList = []
+        for projectElement in parse(workingSetFilePath).getroot() :
+                projectPath = projectElement.attrib["path"]
+                if projectPath :
+                        projectsList.append(projectPath)
+        return projectsList
 
-        projectSubDir = None
-        storageRootElement = parse(storageFilePath).getroot()
-        for storageElement in storageRootElement :
-                if storageElement.attrib["path"] == projectPath :
-                        projectSubDir = storageElement.attrib["subDir"]
-                        break
+def getProjectWorkingDir(projectPath): 
+        storageFilePath = getColtDir() + os.sep + "storage.xml"
 
+        projectSubDir = storageIndex.get(storageFilePath, parseStorage, {}).get(projectPath)
         if projectSubDir is None :
                 return None
 
-        return os.path.expanduser("~") + os.sep + ".colt" + os.sep + "storage" + os.sep + projectSubDir
+        return getColtDir() + os.sep + "storage" + os.sep + projectSubDir
 
 def addToWorkingSet(newProjectPath):
-        workingSetFilePath = os.path.expanduser("~") + os.sep + ".colt" + os.sep + "workingset.xml"
-        projectsList = []
+        workingSetFilePath = getColtDir() + os.sep + "workingset.xml"
 
         # Populate projects list
-        if os.path.exists(workingSetFilePath) :
-                workingSetElement = parse(workingSetFilePath).getroot()
-                for projectElement in workingSetElement :
-                        projectPath = projectElement.attrib["path"]
-                        if projectPath :
-                                projectsList.append(projectPath)
+        oldProjectsList = storageIndex.get(workingSetFilePath, parseWorkingSet, None)
 
         # Remove project path from the list
-        projectsList = list(filter(lambda projectPath : projectPath != newProjectPath, projectsList))
+        projectsList = list(filter(lambda projectPath : projectPath != newProjectPath, oldProjectsList or []))
 
         # Push new project
         projectsList.insert(0, newProjectPath)
 
+        if projectsList == oldProjectsList :
+                # already the most recent project
+                return
+
         # Save the list
         workingSetElement = Element("workingset")
         workingSetElement.set("openRecent", "true")
@@ -58,12 +202,10 @@ def addToWorkingSet(newProjectPath):
                 projectElement = SubElement(workingSetElement, "project")
                 projectElement.set("path", projectPath)
 
-        workingSetFile = open(workingSetFilePath, "w")
-        workingSetFile.write(tostring(workingSetElement).decode("utf-8"))
-        workingSetFile.close()
+        storageIndex.write(workingSetFilePath, tostring(workingSetElement).decode("utf-8"), projectsList)
 
 def runCOLT(settings, projectPath):
-        coltPath = settings.get("coltPath")
+        coltPath = settings.coltPath
 
         platform = sublime.platform()
 
@@ -155,8 +297,7 @@ def exportProject(window, mainDocumentPath, basedir, overrides):
                 pass
         
             if not mainDocumentPath.endswith(".js") :
-                settings = sublime.load_settings(ColtPreferences.NAME)
-                browserPathSetting = settings.get("coltBrowserPath", None)
+                browserPathSetting = coltSettings.coltBrowserPath
                 if browserPathSetting != None :
                 
                     # set custom html launcher
@@ -0,0 +1,42 @@
+import threading
+
+from collections import OrderedDict
+
+# bounded least-recently-used map, safe to share between the UI thread and the RPC workers
+class LRUCache(object):
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key, default = None):
+        with self.lock :
+            if not key in self.entries :
+                return default
+
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock :
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.capacity :
+                self.entries.popitem(last = False)
+
+    def remove(self, key):
+        with self.lock :
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock :
+            self.entries.clear()
+
+    def __contains__(self, key):
+        with self.lock :
+            return key in self.entries
+
+    def __len__(self):
+        with self.lock :
+            return len(self.entries)
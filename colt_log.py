@@ -0,0 +1,65 @@
+from collections import deque
+
+class ColtLogEntry(object):
+    __slots__ = ("level", "source", "message")
+
+    def __init__(self, level, source, message):
+        self.level = level
+        self.source = source
+        self.message = message
+
+    def format(self):
+        if self.source :
+            return "[" + self.level + "] " + self.source + ": " + self.message
+        return "[" + self.level + "] " + self.message
+
+# last capacity COLT log entries. New entries matching the current filter are collected until
+# the next takePending(), so the panel gets one batched append per refresh
+class ColtLogBuffer(object):
+    def __init__(self, capacity):
+        self.entries = deque(maxlen = capacity)
+        self.pending = deque(maxlen = capacity)
+        self.level = None
+        self.source = None
+
+    def add(self, level, source, message):
+        entry = ColtLogEntry(level, source or "", message)
+        self.entries.append(entry)
+        if self.matches(entry) :
+            self.pending.append(entry)
+
+    def takePending(self):
+        pending = list(self.pending)
+        self.pending.clear()
+        return pending
+
+    def matches(self, entry):
+        if not self.level is None and entry.level != self.level :
+            return False
+        if not self.source is None and entry.source != self.source :
+            return False
+        return True
+
+    # None shows everything
+    def setFilter(self, level, source):
+        self.level = level
+        self.source = source
+        self.pending.clear()
+
+    def getFiltered(self):
+        return [ entry for entry in self.entries if self.matches(entry) ]
+
+    def getLevels(self):
+        return sorted(set(entry.level for entry in self.entries))
+
+    def getSources(self):
+        return sorted(set(entry.source for entry in self.entries if entry.source))
+
+    def setCapacity(self, capacity):
+        if capacity != self.entries.maxlen :
+            self.entries = deque(self.entries, maxlen = capacity)
+            self.pending = deque(self.pending, maxlen = capacity)
+
+    def clear(self):
+        self.entries.clear()
+        self.pending.clear()
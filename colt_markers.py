@@ -0,0 +1,171 @@
+import sublime
+
+from collections import OrderedDict
+
+def getCountIcon(count):
+    if count > 9 :
+        return "infinity"
+    return str(count)
+
+# open views of the given windows by file path
+def indexViews(windows):
+    viewsByPath = {}
+    for window in windows :
+        for view in window.views() :
+            fileName = view.file_name()
+            if not fileName is None :
+                viewsByPath.setdefault(fileName, []).append(view)
+    return viewsByPath
+
+# gutter icons grouped into a few region sets per view, one region key (and one add_regions call)
+# per icon. Remembers what is drawn in every view, so that a redraw only touches the region sets
+# whose positions changed
+class GutterMarkers(object):
+    # every region set shows icon; without one, the icon is named after the key minus keyPrefix
+    def __init__(self, keyPrefix, icon = None):
+        self.keyPrefix = keyPrefix
+        self.icon = icon
+        # view id -> (view, { key : sorted positions })
+        self.drawn = {}
+
+    def getIcon(self, key):
+        if not self.icon is None :
+            return self.icon
+        return "Packages/COLT/icons/" + key[len(self.keyPrefix):] + "@2x.png"
+
+    # wanted is view id -> (view, { key : positions })
+    def draw(self, wanted):
+        for viewId, (view, regionSets) in self.drawn.items() :
+            if view.window() is None :
+                # closed
+                continue
+
+            wantedSets = wanted.get(viewId, (view, {}))[1]
+            for key in regionSets :
+                if not key in wantedSets :
+                    view.erase_regions(key)
+
+        drawn = {}
+        for viewId, (view, regionSets) in wanted.items() :
+            drawnSets = self.drawn.get(viewId, (view, {}))[1]
+            sortedSets = {}
+            for key, positions in regionSets.items() :
+                positions = sorted(positions)
+                sortedSets[key] = positions
+                if drawnSets.get(key) != positions :
+                    view.add_regions(key, [ sublime.Region(position) for position in positions ],
+                        "scope", self.getIcon(key), sublime.HIDDEN)
+            drawn[viewId] = (view, sortedSets)
+
+        self.drawn = drawn
+
+    def clear(self):
+        self.draw({})
+
+# call count icons, bucketed 1..9 and infinity
+class CountMarkers(GutterMarkers):
+    prefix = "counts."
+
+    def __init__(self):
+        GutterMarkers.__init__(self, CountMarkers.prefix)
+
+    # errorRows(view) returns the rows of view that show an error icon, or None if there are none
+    def render(self, windows, counts, errorRows):
+        wanted = {}
+        viewsByPath = indexViews(windows)
+        rowsByView = {}
+
+        for info in counts :
+            count = info["count"]
+            if count <= 0 :
+                continue
+
+            views = viewsByPath.get(info["filePath"])
+            if views is None :
+                continue
+
+            position = info["position"]
+            for view in views :
+                if not view.id() in rowsByView :
+                    rowsByView[view.id()] = errorRows(view)
+
+                # do not show count if there is an error in this line
+                rows = rowsByView[view.id()]
+                if rows and view.rowcol(position)[0] in rows :
+                    continue
+
+                regionSets = wanted.setdefault(view.id(), (view, {}))[1]
+                regionSets.setdefault(CountMarkers.prefix + getCountIcon(count), []).append(position)
+
+        self.draw(wanted)
+
+# syntax and runtime error icons, one region set per view
+class ErrorMarkers(GutterMarkers):
+    key = "errors"
+
+    def __init__(self):
+        GutterMarkers.__init__(self, ErrorMarkers.key, "Packages/COLT/icons/error@2x.png")
+
+    # positionsByPath is file path -> error positions
+    def render(self, windows, positionsByPath):
+        wanted = {}
+        for filePath, views in indexViews(windows).items() :
+            positions = positionsByPath.get(filePath)
+            if positions :
+                for view in views :
+                    wanted[view.id()] = (view, { ErrorMarkers.key : list(positions) })
+
+        self.draw(wanted)
+
+class ColtError(object):
+    __slots__ = ("filePath", "position", "row", "message")
+
+    # row is COLT's 1-based row
+    def __init__(self, filePath, position, row, message):
+        self.filePath = filePath
+        self.position = position
+        self.row = row
+        self.message = message
+
+# errors by file and by (0-based) row, for constant-time lookup of the cursor row
+class ErrorRegistry(object):
+    def __init__(self):
+        # file path -> { row : [ errors ] }, files in the order their first error came in
+        self.files = OrderedDict()
+
+    def add(self, error):
+        rows = self.files.setdefault(error.filePath, {})
+        rows.setdefault(error.row - 1, []).append(error)
+
+    def removeFile(self, filePath):
+        self.files.pop(filePath, None)
+
+    def clear(self):
+        self.files = OrderedDict()
+
+    def getErrorsAt(self, filePath, row):
+        rows = self.files.get(filePath)
+        if rows is None :
+            return []
+        return rows.get(row, [])
+
+    def getRows(self, filePath):
+        rows = self.files.get(filePath)
+        if rows is None :
+            return None
+        return rows.keys()
+
+    def getPositionsByPath(self):
+        positionsByPath = {}
+        for filePath, rows in self.files.items() :
+            positionsByPath[filePath] = [ error.position for errors in rows.values() for error in errors ]
+        return positionsByPath
+
+    def __iter__(self):
+        for rows in self.files.values() :
+            for row in sorted(rows) :
+                for error in rows[row] :
+                    yield error
+
+    def __len__(self):
+        return sum(len(errors) for rows in self.files.values() for errors in rows.values())
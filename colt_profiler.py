@@ -0,0 +1,122 @@
+import threading
+import functools
+import cProfile
+import pstats
+import heapq
+import time
+import io
+
+# wraps the methods of the given classes with timing hooks; calls on the thread that started
+# profiling (the UI thread) also run under cProfile
+class ColtProfiler(object):
+    def __init__(self, slowestCount = 20):
+        self.slowestCount = slowestCount
+        self.lock = threading.Lock()
+        self.originals = []
+        self.profile = None
+        self.profileThread = None
+        self.depth = 0
+        self.handlers = {}
+        self.slowest = []
+        self.startTime = None
+
+    def isRunning(self):
+        return not self.profile is None
+
+    def start(self, classes):
+        if self.isRunning() :
+            return
+
+        self.profile = cProfile.Profile()
+        self.profileThread = threading.current_thread()
+        self.depth = 0
+        self.handlers = {}
+        self.slowest = []
+        self.startTime = time.perf_counter()
+
+        for cls in classes :
+            for name, attribute in list(cls.__dict__.items()) :
+                if name.startswith("__") :
+                    continue
+
+                if isinstance(attribute, staticmethod) :
+                    wrapped = staticmethod(self.wrap(cls.__name__ + "." + name, attribute.__func__))
+                elif callable(attribute) :
+                    wrapped = self.wrap(cls.__name__ + "." + name, attribute)
+                else :
+                    continue
+
+                self.originals.append((cls, name, attribute))
+                setattr(cls, name, wrapped)
+
+    # restores the original methods; returns (report text, pstats.Stats or None)
+    def stop(self):
+        if not self.isRunning() :
+            return ("COLT profiler is not running", None)
+
+        for cls, name, attribute in self.originals :
+            setattr(cls, name, attribute)
+        self.originals = []
+
+        profile = self.profile
+        self.profile = None
+
+        stats = None
+        try :
+            stats = pstats.Stats(profile)
+        except TypeError :
+            # nothing ran on the UI thread
+            pass
+
+        return (self.report(stats), stats)
+
+    def wrap(self, name, func):
+        profiler = self
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = profiler.profile
+            profiled = not profile is None and threading.current_thread() is profiler.profileThread and profiler.depth == 0
+            profiler.depth += profiled
+
+            startTime = time.perf_counter()
+            try :
+                if profiled :
+                    return profile.runcall(func, *args, **kwargs)
+                return func(*args, **kwargs)
+            finally :
+                profiler.record(name, time.perf_counter() - startTime)
+                profiler.depth -= profiled
+
+        return wrapper
+
+    def record(self, name, duration):
+        with self.lock :
+            (calls, total, longest) = self.handlers.get(name, (0, 0.0, 0.0))
+            self.handlers[name] = (calls + 1, total + duration, max(longest, duration))
+
+            invocation = (duration, time.perf_counter() - self.startTime, name)
+            if len(self.slowest) < self.slowestCount :
+                heapq.heappush(self.slowest, invocation)
+            else :
+                heapq.heappushpop(self.slowest, invocation)
+
+    def report(self, stats):
+        lines = [ "COLT profile over " + str(round(time.perf_counter() - self.startTime, 1)) + "s", "" ]
+
+        lines.append("{:>7} {:>10} {:>9} {:>9}  {}".format("calls", "total ms", "mean ms", "max ms", "handler"))
+        byTotal = sorted(self.handlers.items(), key = lambda item: item[1][1], reverse = True)
+        for name, (calls, total, longest) in byTotal :
+            lines.append("{:>7} {:>10.1f} {:>9.2f} {:>9.1f}  {}".format(calls, total * 1000, total * 1000 / calls, longest * 1000, name))
+
+        lines.extend([ "", "Slowest invocations:", "{:>9} {:>9}  {}".format("ms", "at s", "handler") ])
+        for duration, at, name in sorted(self.slowest, reverse = True) :
+            lines.append("{:>9.1f} {:>9.2f}  {}".format(duration * 1000, at, name))
+
+        if not stats is None :
+            output = io.StringIO()
+            stats.stream = output
+            stats.sort_stats("cumulative").print_stats(40)
+            lines.extend([ "", "UI thread, by cumulative time:", output.getvalue() ])
+
+        return "\n".join(lines)
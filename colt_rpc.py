@@ -1,20 +1,350 @@
 import sublime
-import urllib, urllib.request
+import http.client
 import json
+import socket
 import COLT.colt
+import COLT.colt_stats
 import calendar, time
 import os
 import threading
+import hashlib
+import functools
+import concurrent.futures
 
-from COLT.colt import ColtPreferences
+from COLT.colt import coltSettings
 
 runAfterAuthorization = None
 statusToSet = "Disconnected from COLT"
 
+# one COLT instance, running one project: its port, session state and everything cached about it
 class ColtConnection(object):
-    port = -1
-    messageId = 1
-    activeSessions = 0
+    def __init__(self, projectPath):
+        self.projectPath = projectPath
+        self.port = -1
+        self.messageId = 1
+        self.activeSessions = 0
+        self.liveVersion = 0
+        self.batchSupported = None
+        self.features = None
+        self.messageIdLock = threading.Lock()
+        self.pool = ColtConnectionPool()
+        self.contentTracker = ContentTracker()
+        self.logCursor = ColtStreamCursor("log messages")
+        self.runtimeErrorCursor = ColtStreamCursor("runtime errors")
+        self.eventSubscription = ColtEventSubscription(self)
+
+    def nextMessageId(self):
+        with self.messageIdLock :
+            messageId = self.messageId
+            self.messageId += 1
+            return messageId
+
+    def isConnected(self):
+        return self.port != -1
+
+# what a reused keep-alive connection fails with when COLT has closed it; RemoteDisconnected
+# (Python 3.5+) is a BadStatusLine
+staleConnectionErrors = (http.client.BadStatusLine, ConnectionResetError, BrokenPipeError)
+
+# keeps keep-alive HTTP connections to COLT per port; shared by the poller thread and the UI thread
+class ColtConnectionPool(object):
+    path = "/rpc/coltService"
+    headers = { "Content-Type" : "application/json", "Connection" : "keep-alive" }
+
+    def __init__(self, maxIdle = 4, timeout = 30):
+        self.lock = threading.Lock()
+        self.idle = {}
+        # connections with a request in flight
+        self.busy = set()
+        self.aborted = False
+        self.maxIdle = maxIdle
+        self.timeout = timeout
+
+    def acquire(self, port):
+        with self.lock :
+            connections = self.idle.get(port)
+            if connections :
+                return connections.pop()
+
+        return http.client.HTTPConnection("localhost", int(port), timeout = self.timeout)
+
+    def release(self, port, connection):
+        with self.lock :
+            connections = self.idle.setdefault(port, [])
+            if len(connections) < self.maxIdle :
+                connections.append(connection)
+                return
+
+        connection.close()
+
+    def close(self, port = None):
+        with self.lock :
+            if port is None :
+                ports = list(self.idle.keys())
+            else :
+                ports = [ port ]
+
+            connections = []
+            for p in ports :
+                connections.extend(self.idle.pop(p, []))
+
+        for connection in connections :
+            connection.close()
+
+    # closes the idle connections and fails the requests in flight, for good
+    def abort(self):
+        self.close()
+        with self.lock :
+            self.aborted = True
+            busy = list(self.busy)
+
+        for connection in busy :
+            try :
+                # wakes up the thread blocked reading the response
+                connection.sock.shutdown(socket.SHUT_RDWR)
+            except (OSError, AttributeError) :
+                pass
+
+    def post(self, port, body):
+        while True :
+            connection = self.acquire(port)
+            reused = not connection.sock is None
+
+            with self.lock :
+                self.busy.add(connection)
+            try :
+                connection.request("POST", ColtConnectionPool.path, body, ColtConnectionPool.headers)
+                response = connection.getresponse()
+                data = response.read()
+            except staleConnectionErrors :
+                connection.close()
+                if reused and not self.aborted :
+                    # COLT dropped the keep-alive connection (restart, idle timeout) - forget the other
+                    # idle ones too and retry on a fresh connection
+                    self.close(port)
+                    continue
+                raise
+            except Exception :
+                # a timeout may come after COLT got the request; never send it twice
+                connection.close()
+                raise
+            finally :
+                with self.lock :
+                    self.busy.discard(connection)
+
+            if response.will_close :
+                connection.close()
+            else :
+                self.release(port, connection)
+
+            if response.status >= 400 :
+                raise http.client.HTTPException("COLT responded with HTTP " + str(response.status))
+
+            return data
+
+# for pings to ports no connection has been established on yet
+connectionPool = ColtConnectionPool()
+
+# one connection per COLT project, so that a frontend and a node.js backend stay live side by side.
+# Each window talks to the project last run from it; other windows use the one connected last
+class ColtConnectionManager(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = {}
+        self.windows = {}
+        self.lastConnected = None
+
+    def get(self, projectPath):
+        with self.lock :
+            connection = self.connections.get(projectPath)
+            if connection is None :
+                connection = ColtConnection(projectPath)
+                self.connections[projectPath] = connection
+            return connection
+
+    def bind(self, window, connection):
+        with self.lock :
+            self.windows[window.id()] = connection
+
+    def setConnected(self, connection):
+        with self.lock :
+            self.lastConnected = connection
+
+    def forWindow(self, window):
+        with self.lock :
+            connection = None
+            if not window is None :
+                connection = self.windows.get(window.id())
+
+            if connection is None :
+                connection = self.lastConnected
+                if connection is None or not connection.isConnected() :
+                    connected = [ c for c in self.connections.values() if c.isConnected() ]
+                    if len(connected) > 0 :
+                        connection = connected[0]
+
+        return connection or noConnection
+
+    def close(self):
+        with self.lock :
+            connections = list(self.connections.values())
+
+        for connection in connections :
+            connection.eventSubscription.stop()
+            connection.pool.close()
+
+connectionManager = ColtConnectionManager()
+
+rpcStats = COLT.colt_stats.RpcStats()
+rpcRecorder = COLT.colt_stats.RpcRecorder()
+
+# the editor event behind the calls made on this thread, for recordings
+rpcContext = threading.local()
+
+def getTrigger():
+    return getattr(rpcContext, "trigger", "other")
+
+# the connection calls on this thread go to: the one a worker, scheduler job or event handler runs
+# for, otherwise the active window's
+def getConnection():
+    connection = getattr(rpcContext, "connection", None)
+    if connection is None :
+        connection = connectionManager.forWindow(sublime.active_window())
+    return connection
+
+def runWithConnection(connection, func, *args):
+    previous = getattr(rpcContext, "connection", None)
+    rpcContext.connection = connection
+    try :
+        return func(*args)
+    finally :
+        rpcContext.connection = previous
+
+# buffer text together with the view.change_count() it was read at
+class BufferContent(str):
+    def __new__(cls, text, changeCount = None):
+        content = str.__new__(cls, text)
+        content.changeCount = changeCount
+        return content
+
+def contentHash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+# slice comparisons run in C, so this stays cheap on multi-megabyte buffers
+def commonPrefixLength(a, b, limit):
+    low = 0
+    high = limit
+    while low < high :
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle] :
+            low = middle
+        else :
+            high = middle - 1
+    return low
+
+def commonSuffixLength(a, b, limit):
+    low = 0
+    high = limit
+    while low < high :
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:len(a) - low] == b[len(b) - middle:len(b) - low] :
+            low = middle
+        else :
+            high = middle - 1
+    return low
+
+# remembers the content COLT last acknowledged per file, so that only the changed span is sent.
+# A delta replaces [start, end) of the acknowledged content (in characters) with text, and
+# hash is the sha1 of the result COLT must verify before using it
+class ContentTracker(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.acknowledged = {}
+
+    def makeDelta(self, filePath, content):
+        with self.lock :
+            acknowledged = self.acknowledged.get(filePath)
+
+        if acknowledged is None :
+            return None, None
+
+        (changeCount, text, textHash) = acknowledged
+        newChangeCount = getattr(content, "changeCount", None)
+
+        if not newChangeCount is None and newChangeCount == changeCount :
+            # buffer untouched since it was acknowledged
+            return { "baseHash" : textHash, "hash" : textHash, "start" : 0, "end" : 0, "text" : "" }, acknowledged
+
+        limit = min(len(text), len(content))
+        prefix = commonPrefixLength(text, content, limit)
+        suffix = commonSuffixLength(text, content, limit - prefix)
+        newText = str(content)
+        newHash = contentHash(newText)
+
+        delta = {
+            "baseHash" : textHash,
+            "hash" : newHash,
+            "start" : prefix,
+            "end" : len(text) - suffix,
+            "text" : newText[prefix:len(newText) - suffix] }
+
+        return delta, (newChangeCount, newText, newHash)
+
+    def acknowledge(self, filePath, acknowledged):
+        with self.lock :
+            self.acknowledged[filePath] = acknowledged
+
+    def forget(self, filePath = None):
+        with self.lock :
+            if filePath is None :
+                self.acknowledged = {}
+            else :
+                self.acknowledged.pop(filePath, None)
+
+
+# RPC worker pool, so that the UI thread never waits on COLT
+executor = concurrent.futures.ThreadPoolExecutor(max_workers = 4)
+
+# trigger names the editor event for recordings, defaulting to the function name. func and the
+# callbacks talk to the connection of the window active at the time of the call. A cancelled call
+# reaches errorCallback with a CancelledError, so whoever waits on it can let go
+def runAsync(func, *args, callback = None, errorCallback = None, trigger = None):
+    trigger = trigger or func.__name__
+    connection = getConnection()
+
+    def run():
+        rpcContext.trigger = trigger
+        return runWithConnection(connection, func, *args)
+
+    future = executor.submit(run)
+
+    def onDone(future):
+        if future.cancelled() :
+            if not errorCallback is None :
+                sublime.set_timeout(lambda: runWithConnection(connection, errorCallback, concurrent.futures.CancelledError()), 0)
+            return
+
+        error = future.exception()
+        if error is None :
+            if not callback is None :
+                sublime.set_timeout(lambda: runWithConnection(connection, callback, future.result()), 0)
+        elif not errorCallback is None :
+            sublime.set_timeout(lambda: runWithConnection(connection, errorCallback, error), 0)
+        else :
+            print("[COLT] " + func.__name__ + " failed: " + str(error))
+
+    future.add_done_callback(onDone)
+    return future
+
+def plugin_unloaded():
+    scheduler.stop()
+    coltSettings.removeListener("colt-scheduler")
+    coltSettings.removeListener("colt-rpc-stats")
+    rpcStats.setTraceFile(None)
+    rpcRecorder.stop()
+    executor.shutdown(wait = False)
+    connectionManager.close()
+    connectionPool.close()
 
 def setStatus(status):
     sublime.set_timeout(lambda: setStatus_(status), 0)    
@@ -27,25 +357,77 @@ def setStatus_(status):
 
 def coltStateUpdate():    
     if isConnected() :
-        ColtConnection.activeSessions = getActiveSessionsCount()
-        if ColtConnection.activeSessions > 0 :
-            # setStatus("COLT: " + str(ColtConnection.activeSessions) + " connections")    
-            setStatus("[~] Connected to COLT")    
+        if getConnection().eventSubscription.isActive() :
+            # COLT pushes session changes
+            return False
+
+        if hasActiveSessions() :
+            # the refresh batch carries getState while sessions are live; this job only has to spot
+            # the first session, and setActiveSessions wakes it up again when the last one ends
+            return False
+
+        setActiveSessions(getActiveSessionsCount())
+        showConnectionStatus()
+    else :
+        showConnectionStatus()
+        # nothing to poll - let the scheduler back off
+        return False
+
+# the status bar always shows the active window's connection, whichever one changed
+def showConnectionStatus():
+    sublime.set_timeout(showConnectionStatus_, 0)
+
+def showConnectionStatus_():
+    connection = connectionManager.forWindow(sublime.active_window())
+    if connection.isConnected() :
+        if connection.activeSessions > 0 :
+            # setStatus("COLT: " + str(connection.activeSessions) + " connections")    
+            setStatus_("[~] Connected to COLT")    
         else :
-            setStatus("Connected to COLT")    
+            setStatus_("Connected to COLT")    
     else :
-        setStatus("Disconnected from COLT")
+        setStatus_("Disconnected from COLT")
             
 def isConnected():
-    return ColtConnection.port != -1
+    return getConnection().isConnected()
 
 def hasActiveSessions():
-    return ColtConnection.activeSessions > 0
+    return getConnection().activeSessions > 0
+
+def setActiveSessions(count):
+    connection = getConnection()
+    if count != connection.activeSessions :
+        started = connection.activeSessions == 0
+        connection.activeSessions = count
+        liveStateChanged()
+
+        if started :
+            # the refresh job backed off while there was nothing to show; fetch the first logs
+            # and errors of the session now
+            scheduler.trigger("refresh", connection)
+        elif count == 0 :
+            # the state job backed off while the refresh batch watched the sessions
+            scheduler.trigger("state", connection)
+
+        showConnectionStatus()
+
+# anything COLT computed for the old live state (completions etc) is stale after this
+def liveStateChanged():
+    getConnection().liveVersion += 1
 
 def disconnect():
-    ColtConnection.port = -1    
-    ColtConnection.messageId = 1
-    ColtConnection.activeSessions = 0
+    connection = getConnection()
+    connection.pool.close()
+
+    connection.port = -1    
+    connection.messageId = 1
+    setActiveSessions(0)
+    connection.batchSupported = None
+    connection.features = None
+    connection.contentTracker.forget()
+    connection.eventSubscription.reset()
+    connection.logCursor.reset()
+    connection.runtimeErrorCursor.reset()
 
     sublime.status_message("Disconnected from COLT")
 
@@ -55,6 +437,7 @@ def runAfterAuthorization():
         runAfterAuthorization = None
         return
 
+# blocks on COLT; call it on the worker pool
 def authorize(window):
     if getSecurityToken() is None :
         makeNewSecurityToken(True, window)
@@ -62,11 +445,7 @@ def authorize(window):
         runAfterAuthorization()
 
 def getSecurityToken(): 
-    settings = sublime.load_settings(ColtPreferences.NAME)
-    if not settings.has("securityToken") :
-            return None
-
-    return settings.get("securityToken")
+    return coltSettings.securityToken
 
 def makeNewSecurityToken(newRequest, window):
     onShortKeyInput('42')
@@ -84,75 +463,174 @@ def onShortKeyInput(shortCode):
         try :
             token = obtainAuthToken(shortCode)
             if token is None :
-                sublime.error_message("Invalid short code entered")        
+                sublime.set_timeout(lambda: sublime.error_message("Invalid short code entered"), 0)
                 authorize()
                 return
 
-            settings = sublime.load_settings(ColtPreferences.NAME)
-            settings.set("securityToken", token)
-            sublime.save_settings(ColtPreferences.NAME)
-            sublime.status_message("Successfully authorized with COLT")
+            coltSettings.set("securityToken", token)
+            sublime.set_timeout(lambda: sublime.status_message("Successfully authorized with COLT"), 0)
 
             runAfterAuthorization()
         except Exception:
-            sublime.error_message("Unable to authorize with COLT. Make sure COLT is active and running")
+            sublime.set_timeout(lambda: sublime.error_message("Unable to authorize with COLT. Make sure COLT is active and running"), 0)
             return
     else :
         sublime.error_message("Short authorization key can't be empty")  
         authorize(sublime.active_window())
 
 def obtainAuthToken(shortCode):
-    response = runRPC(ColtConnection.port, "obtainAuthToken", [ shortCode ])
+    response = runRPC(getConnection().port, "obtainAuthToken", [ shortCode ])
     if "error" in response :
             return None
 
     return response["result"]
 
 def requestShortCode():
-    runRPC(ColtConnection.port, "requestShortCode", [ "Sublime Plugin" ])	    
+    runRPC(getConnection().port, "requestShortCode", [ "Sublime Plugin" ])	    
 
-def runRPC(port, methodName, params):                  
-    jsonRequest = None
-    
-    messageId = ColtConnection.messageId
-    ColtConnection.messageId += 1
+def makeRequest(methodName, params):
+    messageId = getConnection().nextMessageId()
 
     if (params is None) :
-            jsonRequest = { "jsonrpc" : "2.0", "method" : methodName, "id": messageId }
+            return { "jsonrpc" : "2.0", "method" : methodName, "id": messageId }
     else :
-            jsonRequest = { "jsonrpc" : "2.0", "method" : methodName, "params": params, "id": messageId }                        
+            return { "jsonrpc" : "2.0", "method" : methodName, "params": params, "id": messageId }                        
+
+def getStatsName(jsonRequest):
+    if isinstance(jsonRequest, list) :
+        return "batch:" + "+".join(request["method"] for request in jsonRequest)
+    return jsonRequest["method"]
+
+def isErrorResponse(response):
+    if isinstance(response, list) :
+        return any("error" in item for item in response)
+    return "error" in response
+
+# posts through the given pool and records the call in rpcStats
+def postRecorded(pool, port, jsonRequest):
+    body = json.dumps(jsonRequest).encode('UTF-8')
+    startTime = time.perf_counter()
 
-    jsonRequestStr = json.dumps(jsonRequest)
+    try :
+        response = pool.post(port, body)
+    except Exception :
+        duration = time.perf_counter() - startTime
+        rpcStats.record(getStatsName(jsonRequest), duration, len(body), 0, failed = True)
+        if rpcRecorder.isRecording() :
+            rpcRecorder.record(getTrigger(), startTime, duration, jsonRequest, None)
+        raise
 
-    url = "http://localhost:" + str(port) + "/rpc/coltService"
-    req = urllib.request.Request(url)
-    response = None
+    result = json.loads(response.decode("utf-8"))
+    duration = time.perf_counter() - startTime
+    rpcStats.record(getStatsName(jsonRequest), duration, len(body), len(response), error = isErrorResponse(result))
+    if rpcRecorder.isRecording() :
+        rpcRecorder.record(getTrigger(), startTime, duration, jsonRequest, result)
+    return result
+
+def postJSON(port, jsonRequest):
+    connection = getConnection()
+    if connection.port != port :
+        # a ping while connecting; failing it says nothing about the current connection
+        return postRecorded(connectionPool, port, jsonRequest)
 
     try :
-        response = urllib.request.urlopen(req, jsonRequestStr.encode('UTF-8'))
+        return postRecorded(connection.pool, port, jsonRequest)
     except Exception :
         disconnect()
         raise
-    
-    return json.loads(response.read().decode("utf-8"))
+
+def runRPC(port, methodName, params):                  
+    return postJSON(port, makeRequest(methodName, params))
+
+# calls is a list of (methodName, params) pairs; responses come back in the same order
+def runBatchRPC(port, calls):
+    connection = getConnection()
+    if connection.batchSupported == False :
+        return [ runRPC(port, methodName, params) for (methodName, params) in calls ]
+
+    requests = [ makeRequest(methodName, params) for (methodName, params) in calls ]
+    responses = postJSON(port, requests)
+
+    if not isinstance(responses, list) :
+        # older COLT builds reject batches with a single error object - fall back to one call per request
+        connection.batchSupported = False
+        return [ runRPC(port, methodName, params) for (methodName, params) in calls ]
+
+    connection.batchSupported = True
+
+    responsesById = {}
+    for response in responses :
+        responsesById[response.get("id")] = response
+
+    missing = { "error" : { "code" : -32603, "message" : "No response in batch" } }
+    return [ responsesById.get(request["id"], missing) for request in requests ]
+
+# optional protocol extensions this COLT build supports; older builds have none
+def getProtocolFeatures():
+    connection = getConnection()
+    features = connection.features
+    if features is None :
+        try :
+            response = runRPC(connection.port, "getProtocolFeatures", None)
+        except Exception :
+            return []
+
+        features = []
+        if not "error" in response and isinstance(response["result"], list) :
+            features = response["result"]
+        connection.features = features
+
+    return features
+
+def hasFeature(name):
+    return name in getProtocolFeatures()
+
+def isContentMismatch(response):
+    try :
+        return response["error"]["data"]["exceptionTypeName"].endswith("ContentMismatchException")
+    except (KeyError, TypeError, AttributeError) :
+        return False
+
+# params are [ securityToken, filePath ] + leadingParams + [ content ] + trailingParams
+def runContentRPC(methodName, filePath, leadingParams, currentContent, trailingParams = []):
+    def makeParams(content):
+        return [ getSecurityToken(), filePath ] + leadingParams + [ content ] + trailingParams
+
+    connection = getConnection()
+    if not hasFeature("contentDelta") :
+        return runRPC(connection.port, methodName, makeParams(currentContent))
+
+    (delta, acknowledged) = connection.contentTracker.makeDelta(filePath, currentContent)
+    if not delta is None :
+        response = runRPC(connection.port, methodName, makeParams(delta))
+        if not isContentMismatch(response) :
+            connection.contentTracker.acknowledge(filePath, acknowledged)
+            return response
+
+    # nothing acknowledged yet, or COLT lost track of the file - send everything
+    text = str(currentContent)
+    response = runRPC(connection.port, methodName, makeParams(text))
+    connection.contentTracker.acknowledge(filePath, (getattr(currentContent, "changeCount", None), text, contentHash(text)))
+    return response
 
 def reload():
-    return runRPC(ColtConnection.port, "reload", [ getSecurityToken() ])
+    liveStateChanged()
+    return runRPC(getConnection().port, "reload", [ getSecurityToken() ])
 
 def clearLog():
-    return runRPC(ColtConnection.port, "clearLog", [ getSecurityToken() ])
+    return runRPC(getConnection().port, "clearLog", [ getSecurityToken() ])
 
 def getMethodCounts():
-    return runRPC(ColtConnection.port, "getMethodCounts", [ getSecurityToken() ])
+    return runRPC(getConnection().port, "getMethodCounts", [ getSecurityToken() ])
 
 def getLastRuntimeError():
-    return runRPC(ColtConnection.port, "getLastRuntimeError", [ getSecurityToken() ])
+    return runRPC(getConnection().port, "getLastRuntimeError", [ getSecurityToken() ])
 
 def startLive():
     securityToken = getSecurityToken()
-    if not getSecurityToken() is None :                        
+    if not securityToken is None :                        
         try :
-            error = runRPC(ColtConnection.port, "startLive", [ securityToken ])["error"]["data"]["exceptionTypeName"]
+            error = runRPC(getConnection().port, "startLive", [ securityToken ])["error"]["data"]["exceptionTypeName"]
             if error == "codeOrchestra.colt.core.rpc.security.InvalidAuthTokenException" :
                 # auth code expired - we need new one
                 makeNewSecurityToken(True, sublime.active_window())
@@ -161,7 +639,7 @@ def startLive():
             return
 
 def getState():
-    return runRPC(ColtConnection.port, "getState", None)
+    return runRPC(getConnection().port, "getState", None)
 
 def getActiveSessionsCount():
     try :
@@ -170,75 +648,233 @@ def getActiveSessionsCount():
     except Exception :
         return 0
 
+# read position in one of COLT's numbered streams, for builds with the "logCursor" feature. Such
+# builds take the last seen sequence number as an extra parameter and answer with
+# { "epoch" : ..., "cursor" : ..., "entries" : [ { "seq" : ..., ... } ] }; epoch changes when COLT restarts
+class ColtStreamCursor(object):
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.epoch = None
+        self.cursor = None
+
+    # new entries of a response, with notices for anything missed in between
+    def read(self, response):
+        result = response.get("result")
+        if "error" in response or not isinstance(result, dict) :
+            return [], []
+
+        entries = result.get("entries") or []
+        notices = []
+
+        epoch = result.get("epoch")
+        cursor = result.get("cursor")
+        if not self.epoch is None and (epoch != self.epoch or (not cursor is None and not self.cursor is None and cursor < self.cursor)) :
+            notices.append("COLT restarted, " + self.name + " start over")
+        elif not self.cursor is None and len(entries) > 0 and "seq" in entries[-1] :
+            missed = entries[-1]["seq"] - self.cursor - len(entries)
+            if missed > 0 :
+                notices.append(str(missed) + " " + self.name + " were dropped by COLT")
+
+        self.epoch = epoch
+        if not cursor is None :
+            self.cursor = cursor
+        elif len(entries) > 0 and "seq" in entries[-1] :
+            self.cursor = entries[-1]["seq"]
+
+        return notices, entries
+
+# everything the idle refresh needs, in one round-trip
+def getRefreshState():
+    securityToken = getSecurityToken()
+    connection = getConnection()
+    logCursor = connection.logCursor
+    runtimeErrorCursor = connection.runtimeErrorCursor
+
+    useCursors = hasFeature("logCursor")
+    logParams = [ securityToken ]
+    runtimeErrorParams = [ securityToken ]
+    if useCursors :
+        logParams.append(logCursor.cursor)
+        runtimeErrorParams.append(runtimeErrorCursor.cursor)
+
+    responses = runBatchRPC(connection.port, [
+        ("getState", None),
+        ("getLastLogMessages", logParams),
+        ("getLastRuntimeError", runtimeErrorParams),
+        ("getMethodCounts", [ securityToken ]) ])
+
+    try :
+        setActiveSessions(len(responses[0]["result"]["activeConnections"]))
+    except Exception :
+        setActiveSessions(0)
+
+    refreshState = {
+        "state" : responses[0],
+        "logMessages" : responses[1],
+        "runtimeError" : responses[2],
+        "runtimeErrors" : None,
+        "methodCounts" : responses[3] }
+
+    if useCursors :
+        refreshState["runtimeErrors"] = []
+        refreshState["logMessages"] = { "result" : [] }
+
+        # printLogs would drop the entries if the log call failed or no session is live; the cursors
+        # stay put then, so those entries come again with the next refresh
+        if not "error" in responses[1] and hasActiveSessions() :
+            # hand out new entries only, in the shape of the plain calls
+            (runtimeErrorNotices, runtimeErrors) = runtimeErrorCursor.read(responses[2])
+            refreshState["runtimeErrors"] = runtimeErrors
+
+            (notices, entries) = logCursor.read(responses[1])
+            messages = [ { "position" : -1, "message" : notice } for notice in notices + runtimeErrorNotices ]
+            refreshState["logMessages"] = { "result" : messages + entries }
+
+    return refreshState
+
 def reloadScriptAt(filePath, position, currentContent):
-    return runRPC(ColtConnection.port, "reloadScriptAt", [ getSecurityToken(), filePath, position, currentContent ])
+    return runContentRPC("reloadScriptAt", filePath, [ position ], currentContent)
 
 def getDeclarationPosition(filePath, position, currentContent):
-    return runRPC(ColtConnection.port, "getDeclarationPosition", [ getSecurityToken(), filePath, position, currentContent ])
+    return runContentRPC("getDeclarationPosition", filePath, [ position ], currentContent)
+
+# one lookup per position: the first call brings COLT up to date with the buffer, the rest go in a
+# batch that references it by hash (or, without content deltas, repeats the content)
+def getDeclarationPositions(filePath, positions, currentContent):
+    responses = [ getDeclarationPosition(filePath, positions[0], currentContent) ]
+    if len(positions) == 1 :
+        return responses
+
+    content = str(currentContent)
+    if hasFeature("contentDelta") :
+        (delta, acknowledged) = getConnection().contentTracker.makeDelta(filePath, currentContent)
+        if not delta is None :
+            content = delta
+
+    calls = [ ("getDeclarationPosition", [ getSecurityToken(), filePath, position, content ]) for position in positions[1:] ]
+    return responses + runBatchRPC(getConnection().port, calls)
 
 def getContextForPosition(filePath, position, currentContent, contextType):
-    return runRPC(ColtConnection.port, "getContextForPosition", [ getSecurityToken(), filePath, position, currentContent, contextType ])
+    return runContentRPC("getContextForPosition", filePath, [ position ], currentContent, [ contextType ])
 
 def evaluateExpression(filePath, expression, position, currentContent):
-    return runRPC(ColtConnection.port, "evaluateExpression", [ getSecurityToken(), filePath, expression, position, currentContent ])
+    return runContentRPC("evaluateExpression", filePath, [ expression, position ], currentContent)
 
 def getCallCount(filePath, position, currentContent):
-    return runRPC(ColtConnection.port, "getCallCount", [ getSecurityToken(), filePath, position, currentContent ])
+    return runContentRPC("getCallCount", filePath, [ position ], currentContent)
 
 def resetCallCounts():
-    return runRPC(ColtConnection.port, "resetCallCounts", [ getSecurityToken() ])
+    return runRPC(getConnection().port, "resetCallCounts", [ getSecurityToken() ])
 
 def getEnclosingTagId(filePath, position, currentContent):
-    return runRPC(ColtConnection.port, "getEnclosingTagId", [ getSecurityToken(), filePath, position, currentContent ])
+    return runContentRPC("getEnclosingTagId", filePath, [ position ], currentContent)
 
 def findAndShowJavaDocs(filePath, position, currentContent):
-    return runRPC(ColtConnection.port, "findAndShowJavaDocs", [ getSecurityToken(), filePath, position, currentContent ])
+    return runContentRPC("findAndShowJavaDocs", filePath, [ position ], currentContent)
 
 def angularExpressionCompletion(tagId, leftExpression):
-    return runRPC(ColtConnection.port, "angularExpressionCompletion", [ getSecurityToken(), tagId, leftExpression ])
+    return runRPC(getConnection().port, "angularExpressionCompletion", [ getSecurityToken(), tagId, leftExpression ])
     
 def angularDirectiveDeclaration(filePath, position, currentContent):
-    return runRPC(ColtConnection.port, "angularDirectiveDeclaration", [ getSecurityToken(), filePath, position, currentContent ])
+    return runContentRPC("angularDirectiveDeclaration", filePath, [ position ], currentContent)
 
 def getLastLogMessages():
-    return runRPC(ColtConnection.port, "getLastLogMessages", [ getSecurityToken() ])
+    return runRPC(getConnection().port, "getLastLogMessages", [ getSecurityToken() ])
 
 def getMethodId(filePath, position, currentContent):
-    resultJSON = runRPC(ColtConnection.port, "getMethodId", [ getSecurityToken(), filePath, position, currentContent ])
+    resultJSON = runContentRPC("getMethodId", filePath, [ position ], currentContent)
     if "error" in resultJSON :
         return None
 
     return resultJSON["result"]
 
 def runMethod(methodId):
-    runRPC(ColtConnection.port, "runMethod", [ getSecurityToken(), methodId ])
+    runRPC(getConnection().port, "runMethod", [ getSecurityToken(), methodId ])
 
-def establishConnection(port):
-    ColtConnection.port = port
+def establishConnection(connection, port):
+    connection.port = port
+    connectionManager.setConnected(connection)
     sublime.status_message("Established connection with COLT on port " + port)
+    scheduler.trigger("state", connection)
+    scheduler.trigger("events", connection)
+    scheduler.trigger("refresh", connection)
     #time.sleep(2)
 
-def initAndConnect(settings, projectPath): 
+connectLock = threading.Lock()
+# project path -> thread connecting to it
+connectThreads = {}
+
+# starts COLT if needed and connects in the background; window then talks to this project and
+# onConnected(port) is called on the UI thread, for the new connection
+def initAndConnect(settings, projectPath, onConnected = None, window = None): 
+    with connectLock :
+        connectThread = connectThreads.get(projectPath)
+        if not connectThread is None and connectThread.is_alive() :
+            sublime.status_message("Still waiting for COLT to start...")
+            return False
+
+        connectThread = threading.Thread(target = connect, args = (settings, projectPath, onConnected, window), name = "COLT connect")
+        connectThread.daemon = True
+        connectThreads[projectPath] = connectThread
+        connectThread.start()
+
+    return True
+
+def connect(settings, projectPath, onConnected, window):
     sublime.status_message("Trying to establish connection with COLT...")
 
     port = locateCOLTServicePort(projectPath)
-    if not port is None :
-        establishConnection(port)
-        return port
+    if port is None :
+        COLT.colt.runCOLT(settings, projectPath)
+        port = waitForServicePort(projectPath, 20)
 
-    COLT.colt.runCOLT(settings, projectPath)
-    
-    timeout = 20
-    while timeout > 0 :
-        time.sleep(0.3)
-        timeout -= 0.3
+    if port is None :
+        sublime.set_timeout(lambda: sublime.error_message("Can't establish connection with COLT"), 0)
+        return
+
+    def onPortFound():
+        connection = connectionManager.get(projectPath)
+        establishConnection(connection, port)
+        if not window is None :
+            connectionManager.bind(window, connection)
+        showConnectionStatus()
+
+        if not onConnected is None :
+            runWithConnection(connection, onConnected, port)
 
-        port = locateCOLTServicePort(projectPath)
-        if not port is None :
-            establishConnection(port)
-            return port
+    sublime.set_timeout(onPortFound, 0)
+
+# there is no portable file watching in the bundled python, so stat rpc.info with exponential
+# backoff and only read and ping when it appears or COLT touches it again
+def waitForServicePort(projectPath, timeout):
+    startTime = time.time()
+    delay = 0.05
+    lastStamp = None
+
+    while time.time() - startTime < timeout :
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+        rpcInfoFilePath = getRPCInfoFilePath(projectPath)
+        stamp = None
+        if not rpcInfoFilePath is None :
+            try :
+                stat = os.stat(rpcInfoFilePath)
+                stamp = (stat.st_mtime_ns, stat.st_size)
+            except OSError :
+                pass
+
+        if not stamp is None and stamp != lastStamp :
+            lastStamp = stamp
+            port = locateCOLTServicePort(projectPath)
+            if not port is None :
+                return port
+
+        sublime.status_message("Waiting for COLT to start (" + str(int(time.time() - startTime)) + "s)...")
 
-    sublime.error_message("Can't establish connection with COLT")
     return None
 
 def locateCOLTServicePort(projectPath): 
@@ -253,13 +889,16 @@ def locateCOLTServicePort(projectPath):
 
     return port   
 
-def getRPCPortForProject(projectPath):
+def getRPCInfoFilePath(projectPath):
     storageDir = COLT.colt.getProjectWorkingDir(projectPath)
     if storageDir is None :
         return None
 
-    rpcInfoFilePath = storageDir + os.sep + "rpc.info"
-    if not os.path.exists(rpcInfoFilePath) :
+    return storageDir + os.sep + "rpc.info"
+
+def getRPCPortForProject(projectPath):
+    rpcInfoFilePath = getRPCInfoFilePath(projectPath)
+    if rpcInfoFilePath is None or not os.path.exists(rpcInfoFilePath) :
         return None
 
     timePassedSinceModification = int(calendar.timegm(time.gmtime())) - int(os.path.getmtime(rpcInfoFilePath))
@@ -269,12 +908,306 @@ def getRPCPortForProject(projectPath):
     with open(rpcInfoFilePath, "r") as rpcInfoFile :
         return rpcInfoFile.read().split(":")[1]
 
-def set_interval(func, sec):
-    def func_wrapper():
-        set_interval(func, sec)
-        func()
-    t = threading.Timer(sec, func_wrapper)
-    t.start()
-    return t
+class ColtJob(object):
+    def __init__(self, name, func, interval, requiresConnection):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.requiresConnection = requiresConnection
+        self.backoff = 1
+        self.nextRun = 0
+        self.triggered = False
+
+# one long-lived thread for the periodic background work of one connection. A job that returns
+# False had nothing to do and backs off exponentially, as do jobs that need a connection while
+# disconnected; everything slows down further while no Sublime view has focus
+class ColtScheduler(object):
+    maxBackoff = 16
+    unfocusedFactor = 4
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.condition = threading.Condition()
+        self.jobs = {}
+        self.intervals = {}
+        self.thread = None
+        self.running = False
+        self.focused = True
+
+    def schedule(self, name, func, interval, requiresConnection = False):
+        with self.condition :
+            self.jobs[name] = ColtJob(name, func, self.intervals.get(name, interval), requiresConnection)
+            self.condition.notify()
+
+    def setInterval(self, name, interval):
+        with self.condition :
+            self.intervals[name] = interval
+            job = self.jobs.get(name)
+            if not job is None :
+                job.interval = interval
+                job.nextRun = 0
+                self.condition.notify()
+
+    # run the job as soon as possible and forget its backoff
+    def trigger(self, name):
+        with self.condition :
+            job = self.jobs.get(name)
+            if not job is None :
+                job.backoff = 1
+                job.nextRun = 0
+                job.triggered = True
+                self.condition.notify()
+
+    def setFocused(self, focused):
+        with self.condition :
+            if self.focused != focused :
+                self.focused = focused
+                if focused :
+                    for job in self.jobs.values() :
+                        job.nextRun = 0
+                    self.condition.notify()
+
+    def start(self):
+        with self.condition :
+            if self.running :
+                return
+            self.running = True
+
+        self.thread = threading.Thread(target = self.loop, name = "COLT scheduler " + str(self.connection.projectPath))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.condition :
+            self.running = False
+            self.condition.notify()
+
+    def nextJob(self):
+        with self.condition :
+            while self.running :
+                now = time.time()
+                dueJob = None
+                for job in self.jobs.values() :
+                    if dueJob is None or job.nextRun < dueJob.nextRun :
+                        dueJob = job
+
+                if dueJob is None :
+                    self.condition.wait()
+                elif dueJob.nextRun > now :
+                    self.condition.wait(dueJob.nextRun - now)
+                else :
+                    dueJob.triggered = False
+                    return dueJob
+
+            return None
+
+    def loop(self):
+        while True :
+            job = self.nextJob()
+            if job is None :
+                return
+
+            worked = False
+            if self.connection.isConnected() or not job.requiresConnection :
+                rpcContext.trigger = job.name
+                rpcContext.connection = self.connection
+                try :
+                    worked = not job.func() is False
+                except Exception as e :
+                    print("[COLT] " + job.name + " failed: " + str(e))
+                rpcContext.connection = None
+
+            with self.condition :
+                if worked :
+                    job.backoff = 1
+                else :
+                    job.backoff = min(job.backoff * 2, ColtScheduler.maxBackoff)
+
+                delay = job.interval * job.backoff
+                if not self.focused :
+                    delay *= ColtScheduler.unfocusedFactor
+
+                # trigger() may have asked for another run meanwhile
+                if job.triggered :
+                    job.nextRun = 0
+                else :
+                    job.nextRun = time.time() + delay
+
+# a ColtScheduler per connection, so that a hung COLT stalls only its own polling. Jobs, intervals
+# and focus apply to all of them; noConnection has one too, for the jobs that run disconnected
+class ColtSchedulers(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, func, interval, requiresConnection)
+        self.jobs = []
+        self.intervals = {}
+        self.focused = True
+        self.running = False
+        # connection -> its ColtScheduler
+        self.schedulers = {}
+
+    def get(self, connection):
+        with self.lock :
+            connectionScheduler = self.schedulers.get(connection)
+            if connectionScheduler is None :
+                connectionScheduler = ColtScheduler(connection)
+                connectionScheduler.intervals = dict(self.intervals)
+                connectionScheduler.focused = self.focused
+                for (name, func, interval, requiresConnection) in self.jobs :
+                    connectionScheduler.schedule(name, func, interval, requiresConnection)
+                if self.running :
+                    connectionScheduler.start()
+                self.schedulers[connection] = connectionScheduler
+            return connectionScheduler
+
+    def getAll(self):
+        with self.lock :
+            return list(self.schedulers.values())
+
+    def schedule(self, name, func, interval, requiresConnection = False):
+        with self.lock :
+            self.jobs = [ job for job in self.jobs if job[0] != name ] + [ (name, func, interval, requiresConnection) ]
+        for connectionScheduler in self.getAll() :
+            connectionScheduler.schedule(name, func, interval, requiresConnection)
+
+    def setInterval(self, name, interval):
+        with self.lock :
+            self.intervals[name] = interval
+        for connectionScheduler in self.getAll() :
+            connectionScheduler.setInterval(name, interval)
+
+    # for the given connection, by default the one of this thread
+    def trigger(self, name, connection = None):
+        self.get(connection or getConnection()).trigger(name)
+
+    def setFocused(self, focused):
+        with self.lock :
+            self.focused = focused
+        for connectionScheduler in self.getAll() :
+            connectionScheduler.setFocused(focused)
+
+    def start(self):
+        with self.lock :
+            self.running = True
+        self.get(noConnection)
+        for connectionScheduler in self.getAll() :
+            connectionScheduler.start()
+
+    def stop(self):
+        with self.lock :
+            self.running = False
+        for connectionScheduler in self.getAll() :
+            connectionScheduler.stop()
+
+scheduler = ColtSchedulers()
+
+# long-poll channel for COLT builds with the "eventSubscription" feature: waitForEvents blocks until
+# something happens and returns { "cursor" : ..., "events" : [ { "type" : ..., ... } ] }. Event types are
+# "sessions" (activeConnections), "log" (messages), "runtimeError" (error) and "counts" (counts), payloads
+# shaped like the results of the matching polling calls. Listeners are called on the UI thread.
+# While the channel is up the polling jobs stand down; when it drops they take over again
+class ColtEventSubscription(object):
+    waitTimeout = 25
+    # shared by all connections; handlers run with the connection of the event
+    listeners = {}
+    listenersLock = threading.Lock()
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.lock = threading.Lock()
+        self.thread = None
+        self.cursor = None
+        self.stopped = False
+        self.pool = ColtConnectionPool(maxIdle = 1, timeout = ColtEventSubscription.waitTimeout + 10)
+
+    # keyed by name, so a reloaded plugin module replaces its old handlers
+    @staticmethod
+    def addListener(eventType, handler):
+        name = handler.__module__ + "." + handler.__qualname__
+        with ColtEventSubscription.listenersLock :
+            ColtEventSubscription.listeners.setdefault(eventType, {})[name] = handler
+
+    def isActive(self):
+        with self.lock :
+            return not self.thread is None and self.thread.is_alive()
+
+    # scheduler job
+    def ensureRunning(self):
+        if self.stopped or self.isActive() or not hasFeature("eventSubscription") :
+            return False
+
+        with self.lock :
+            self.thread = threading.Thread(target = self.loop, args = (self.connection.port, ), name = "COLT events")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def loop(self, port):
+        rpcContext.trigger = "events"
+        rpcContext.connection = self.connection
+        while not self.stopped and self.connection.port == port :
+            request = makeRequest("waitForEvents", [ getSecurityToken(), self.cursor, ColtEventSubscription.waitTimeout * 1000 ])
+            try :
+                response = postRecorded(self.pool, port, request)
+            except Exception :
+                break
+
+            if "error" in response or response["result"] is None :
+                break
+
+            result = response["result"]
+            self.cursor = result.get("cursor", self.cursor)
+            for event in result.get("events", []) :
+                self.dispatch(event)
+
+        self.pool.close()
+        if self.stopped :
+            return
+
+        # fall back to polling right away
+        scheduler.trigger("state", self.connection)
+        scheduler.trigger("refresh", self.connection)
+
+    def dispatch(self, event):
+        eventType = event.get("type")
+        if eventType == "sessions" :
+            setActiveSessions(len(event["activeConnections"]))
+
+        with ColtEventSubscription.listenersLock :
+            handlers = list(ColtEventSubscription.listeners.get(eventType, {}).values())
+
+        for handler in handlers :
+            sublime.set_timeout(functools.partial(runWithConnection, self.connection, handler, event), 0)
+
+    def reset(self):
+        self.cursor = None
+
+    # for good: the plugin is being unloaded, and a reloaded module opens its own channel
+    def stop(self):
+        self.stopped = True
+        self.pool.abort()
+
+ColtEventSubscription.addListener("sessions", lambda event: showConnectionStatus())
+
+# stands in for the connection while there is none
+noConnection = ColtConnection(None)
+
+# scheduler job
+def ensureEventSubscription():
+    return getConnection().eventSubscription.ensureRunning()
+
+def configureScheduler():
+    scheduler.setInterval("state", coltSettings.statePollInterval / 1000.0)
+    scheduler.setInterval("refresh", coltSettings.refreshInterval / 1000.0)
+
+# "rpcTraceFile" streams every call as a JSON line to that path
+def configureStats():
+    rpcStats.setTraceFile(coltSettings.rpcTraceFile)
+
+def plugin_loaded():
+    coltSettings.load()
+    coltSettings.addListener("colt-scheduler", configureScheduler)
+    coltSettings.addListener("colt-rpc-stats", configureStats)
+    scheduler.start()
 
-set_interval(coltStateUpdate, 0.8)    
+scheduler.schedule("state", coltStateUpdate, 0.8)
+scheduler.schedule("events", ensureEventSubscription, 2, requiresConnection = True)
@@ -0,0 +1,193 @@
+import threading
+import os
+import json
+import time
+import gzip
+
+from collections import deque
+
+# per-method call statistics; latency percentiles come from the most recent samples only
+class RpcMethodStats(object):
+    __slots__ = ("calls", "errors", "failures", "requestBytes", "responseBytes", "totalTime", "maxTime", "samples")
+
+    def __init__(self, sampleCapacity):
+        self.calls = 0
+        self.errors = 0
+        self.failures = 0
+        self.requestBytes = 0
+        self.responseBytes = 0
+        self.totalTime = 0.0
+        self.maxTime = 0.0
+        self.samples = deque(maxlen = sampleCapacity)
+
+    def percentile(self, q):
+        samples = sorted(self.samples)
+        if len(samples) == 0 :
+            return 0.0
+
+        return samples[min(len(samples) - 1, int(round(q * (len(samples) - 1))))]
+
+class RpcStats(object):
+    def __init__(self, sampleCapacity = 1000):
+        self.sampleCapacity = sampleCapacity
+        self.lock = threading.Lock()
+        self.methods = {}
+        self.startTime = time.time()
+        self.traceFilePath = None
+        self.traceFile = None
+
+    # error is True for a JSON-RPC error response, failed for a transport failure (no response at all)
+    def record(self, methodName, duration, requestBytes, responseBytes, error = False, failed = False):
+        with self.lock :
+            stats = self.methods.get(methodName)
+            if stats is None :
+                stats = RpcMethodStats(self.sampleCapacity)
+                self.methods[methodName] = stats
+
+            stats.calls += 1
+            stats.requestBytes += requestBytes
+            stats.responseBytes += responseBytes
+            stats.totalTime += duration
+            stats.maxTime = max(stats.maxTime, duration)
+            stats.samples.append(duration)
+            if error :
+                stats.errors += 1
+            if failed :
+                stats.failures += 1
+
+            if not self.traceFile is None :
+                self.writeTrace({
+                    "time" : round(time.time(), 3),
+                    "method" : methodName,
+                    "ms" : round(duration * 1000, 3),
+                    "requestBytes" : requestBytes,
+                    "responseBytes" : responseBytes,
+                    "error" : error,
+                    "failed" : failed })
+
+    def writeTrace(self, entry):
+        try :
+            self.traceFile.write(json.dumps(entry) + "\n")
+            self.traceFile.flush()
+        except Exception :
+            # a full disk or a removed file should not break RPC
+            self.closeTrace()
+
+    # None or an empty path turns tracing off
+    def setTraceFile(self, path):
+        with self.lock :
+            if path == self.traceFilePath :
+                return
+
+            self.closeTrace()
+            self.traceFilePath = path
+            if path :
+                try :
+                    self.traceFile = open(path, "a", encoding = "utf-8")
+                except Exception as e :
+                    print("COLT: cannot open RPC trace file " + path + ": " + str(e))
+
+    def closeTrace(self):
+        if not self.traceFile is None :
+            try :
+                self.traceFile.close()
+            except Exception :
+                pass
+        self.traceFile = None
+
+    def reset(self):
+        with self.lock :
+            self.methods = {}
+            self.startTime = time.time()
+
+    def report(self):
+        with self.lock :
+            lines = [ "COLT RPC statistics for the last " + str(int(time.time() - self.startTime)) + "s", "" ]
+            lines.append("{:>7} {:>6} {:>6} {:>9} {:>9} {:>9} {:>9} {:>10} {:>10}  {}".format(
+                "calls", "errors", "failed", "p50 ms", "p95 ms", "p99 ms", "max ms", "sent KB", "recv KB", "method"))
+
+            byTotalTime = sorted(self.methods.items(), key = lambda item: item[1].totalTime, reverse = True)
+            for methodName, stats in byTotalTime :
+                lines.append("{:>7} {:>6} {:>6} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>10.1f} {:>10.1f}  {}".format(
+                    stats.calls, stats.errors, stats.failures,
+                    stats.percentile(0.50) * 1000, stats.percentile(0.95) * 1000, stats.percentile(0.99) * 1000,
+                    stats.maxTime * 1000, stats.requestBytes / 1024.0, stats.responseBytes / 1024.0, methodName))
+
+            if len(self.methods) == 0 :
+                lines.append("(no calls yet)")
+
+            if self.traceFilePath :
+                lines.extend([ "", "Tracing to " + self.traceFilePath ])
+
+            return "\n".join(lines)
+
+# captures a session's RPC traffic for benchmarks/replay_session.py: a gzipped JSON line per call with
+# its offset from the start, duration, the editor event that caused it, the request and the response
+class RpcRecorder(object):
+    version = 1
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.file = None
+        self.rawFile = None
+        self.path = None
+        self.startTime = None
+
+    def isRecording(self):
+        return not self.file is None
+
+    def start(self, path):
+        with self.lock :
+            if not self.file is None :
+                return
+
+            # requests carry the security token and whole buffers; only the user may read them, and
+            # O_EXCL keeps a file someone else placed at the path from being written to
+            fileDescriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o600)
+            self.rawFile = os.fdopen(fileDescriptor, "wb")
+            self.file = gzip.open(self.rawFile, "wt", encoding = "utf-8")
+            self.path = path
+            self.startTime = time.perf_counter()
+            self.write({ "version" : RpcRecorder.version, "started" : round(time.time(), 3) })
+
+    # returns the path of the finished recording
+    def stop(self):
+        with self.lock :
+            if self.file is None :
+                return None
+
+            self.close()
+            return self.path
+
+    # response is None when the call failed without one
+    def record(self, trigger, startTime, duration, request, response):
+        with self.lock :
+            if self.file is None :
+                return
+
+            self.write({
+                "t" : round(startTime - self.startTime, 4),
+                "ms" : round(duration * 1000, 3),
+                "trigger" : trigger,
+                "request" : request,
+                "response" : response })
+
+    def write(self, entry):
+        try :
+            self.file.write(json.dumps(entry, separators = (",", ":")) + "\n")
+        except Exception as e :
+            print("COLT: RPC recording stopped: " + str(e))
+            try :
+                self.close()
+            except Exception :
+                pass
+
+    # the gzip stream leaves the file it was given open
+    def close(self):
+        (file, rawFile) = (self.file, self.rawFile)
+        self.file = None
+        self.rawFile = None
+        try :
+            file.close()
+        finally :
+            rawFile.close()
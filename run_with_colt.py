@@ -1,13 +1,14 @@
 import sublime, sublime_plugin
-import COLT.colt, COLT.colt_rpc
+import COLT.colt, COLT.colt_rpc, COLT.colt_cache, COLT.colt_markers, COLT.colt_log, COLT.colt_profiler
 import functools
 import os.path
+import tempfile
 import json
 import re
 import time
 
-from COLT.colt import ColtPreferences, isColtFile
-from COLT.colt_rpc import ColtConnection, isConnected, hasActiveSessions
+from COLT.colt import coltSettings, isColtFile
+from COLT.colt_rpc import getConnection, isConnected, hasActiveSessions
 
 def getWordPosition(view):
         position = getPosition(view)
@@ -27,18 +28,18 @@ def getPositionEnd(view):
         return position.end()
 
 def getContent(view):
-        return view.substr(sublime.Region(0, view.size()))
+        return COLT.colt_rpc.BufferContent(view.substr(sublime.Region(0, view.size())), view.change_count())
+
+# completion answers arriving later than this (in ms) are cached but no longer popped up
+def getCompletionDeadline():
+        return coltSettings.completionDeadline
 
 def isAutosaveEnabled():
-        settings = sublime.load_settings(ColtPreferences.NAME)
-        return settings.get("autosave", False)
+        return coltSettings.autosave
 
 class ToggleAutosaveCommand(sublime_plugin.ApplicationCommand):
         def run(self):
-                currentValue = isAutosaveEnabled()
-                settings = sublime.load_settings(ColtPreferences.NAME)
-                settings.set("autosave", not currentValue)
-                sublime.save_settings(ColtPreferences.NAME)
+                coltSettings.set("autosave", not isAutosaveEnabled())
 
         def description(self):
                 if isAutosaveEnabled() :
@@ -46,15 +47,131 @@ class ToggleAutosaveCommand(sublime_plugin.ApplicationCommand):
                 else :
                         return "Enable Autosave"
 
+# writes each dirty view once per typing burst: after autosaveDelay ms without typing, and at
+# the latest autosaveMaxLatency ms after the first unsaved keystroke. With autosaveLivePush,
+# js/html buffers are pushed to COLT through reloadScriptAt instead of being written to disk
 class ColtAutosaveListener(sublime_plugin.EventListener):
         
         def on_modified(self, view):
                 # only allow in js/html/css/less
                 if isAutosaveEnabled() and (view.file_name() != None) and (re.match(".*\\.(html?|js|css|less)$", view.file_name()) != None) :
+                        ColtAutosaveListener.debouncer.delay = coltSettings.autosaveDelay
+                        ColtAutosaveListener.debouncer.maxLatency = coltSettings.autosaveMaxLatency
+                        ColtAutosaveListener.debouncer.touch(view)
+
+        def on_post_save(self, view):
+                # saved by hand, or by us
+                ColtAutosaveListener.debouncer.cancel(view)
+
+        def on_close(self, view):
+                ColtAutosaveListener.debouncer.cancel(view)
+
+        @staticmethod
+        def flush(view):
+                if view.window() is None or not view.is_dirty() :
+                        return
+
+                if coltSettings.autosaveLivePush and isColtFile(view) and isConnected() and hasActiveSessions() :
+                        COLT.colt_rpc.runAsync(COLT.colt_rpc.reloadScriptAt, view.file_name(), getPositionEnd(view), getContent(view),
+                                trigger = "on_modified")
+                else :
                         view.run_command("save")
 
 
+# runs on the RPC worker pool
+def fetchCompletions(fileName, position, content, requestVars, before, after):
+        response = None
+        if requestVars == True :
+            response = COLT.colt_rpc.evaluateExpression(fileName, "?", position, content)
+        else :
+            response = COLT.colt_rpc.getContextForPosition(fileName, position, content, "PROPERTIES")
+        if "error" in response :
+                return None
+
+        result = response["result"]
+        if result is None :
+            if re.match("\\.js$", fileName) == None :
+                # Between {{ and }}
+                if (re.match(".*{{[^{}]*$", before) != None) and (re.match("^[^{}]*}}.*", after)):
+                    try : 
+                        tagId = COLT.colt_rpc.getEnclosingTagId(fileName, position, content)["result"]
+                        result = COLT.colt_rpc.angularExpressionCompletion(tagId, re.match(".*{{([^{}]*)$", before).group(1))["result"]
+                    except KeyError :
+                        pass
+                else :
+                    # Between <...=" and "
+                    if (re.match(".*<[^>]+=\"[^\"]*$", before) != None) and (re.match("^[^\"]*\".*", after)):
+                        try : 
+                            tagId = COLT.colt_rpc.getEnclosingTagId(fileName, position, content)["result"]
+                            result = COLT.colt_rpc.angularExpressionCompletion(tagId, re.match(".*<[^>]+=\"([^\"]*)$", before).group(1))["result"]
+                        except KeyError :
+                            pass
+                
+        else :
+            result = json.loads(result)
+
+        return result
+
+# completions are narrowed locally while the user keeps typing after the dot
+def filterCompletions(result, prefix):
+        if not prefix :
+                return result
+
+        prefix = prefix.lower()
+        return [ resultStr for resultStr in result if resultStr.lower().startswith(prefix) ]
+
+# the receiver expression left of the dot (empty for variable completions), and a fingerprint
+# of the buffer outside the current line, so typing on the line itself keeps the entry
+def getCompletionKey(view, content, line, before, requestVars):
+        receiver = ""
+        if not requestVars :
+                receiverMatch = re.search("[\\w$][\\w$.]*$", before)
+                if receiverMatch != None :
+                        receiver = receiverMatch.group(0)
+
+        fingerprint = hash((content[:line.begin()], content[line.end():]))
+        return (view.file_name(), requestVars, receiver, fingerprint, getConnection().liveVersion)
+
+# identifiers a dot never follows; not worth a speculative request
+prefetchSkipWords = frozenset([ "break", "case", "catch", "const", "continue", "default", "delete", "do", "else",
+        "finally", "for", "function", "if", "in", "instanceof", "let", "new", "return", "switch", "throw", "try",
+        "typeof", "var", "void", "while", "with", "yield" ])
+# "this." still completes, but none of these has a declaration to go to
+declarationSkipWords = prefetchSkipWords | frozenset([ "this", "null", "true", "false", "undefined" ])
+
+def makeCompletions(result):
+        completitions = []
+        if not result is None :
+                for resultStr in result :
+                        if "{})" in resultStr :
+                                resultStr = resultStr.replace("{})", "")
+
+                        replaceStr = resultStr
+                        displayStr = resultStr
+                        cursiveStr = ""
+
+                        if "(" in resultStr :
+                                replaceStr = resultStr[:resultStr.index("(")]
+                                displayStr = replaceStr
+                                cursiveStr = resultStr
+
+                        if cursiveStr != "" :
+                                displayStr = cursiveStr
+                                cursiveStr = ""
+                        completitions.append((displayStr + "\t" + cursiveStr + "[COLT]", replaceStr.replace('$', '\$')))
+
+        return completitions
+
 class ColtCompletitions(sublime_plugin.EventListener):
+        cache = COLT.colt_cache.LRUCache(64)
+        # view id -> the one completion request still wanted for that view
+        pending = {}
+        # (view id, request) of the one speculative request in flight
+        prefetching = None
+        # keys already prefetched, answered or not; the key changes with the buffer and live state
+        prefetched = COLT.colt_cache.LRUCache(256)
+        # without content deltas each prefetch posts the whole buffer; skip big ones
+        prefetchMaxContent = 65536
         
         def on_query_completions(self, view, prefix, locations):                
                 if not isColtFile(view) :
@@ -80,60 +197,143 @@ class ColtCompletitions(sublime_plugin.EventListener):
                 if not isConnected() or not hasActiveSessions() :
                         return []
 
-                response = None
-                if requestVars == True :
-                    response = COLT.colt_rpc.evaluateExpression(view.file_name(), "?", position, getContent(view))
-                else :
-                    response = COLT.colt_rpc.getContextForPosition(view.file_name(), position, getContent(view), "PROPERTIES")
-                if "error" in response :
-                        return []
+                line = view.line(position)
+                before = view.substr(sublime.Region(line.begin(), position))
+                after = view.substr(sublime.Region(position, line.end()))
+                content = getContent(view)
 
-                result = response["result"]
-                if result is None :
-                    if re.match("\\.js$", view.file_name()) == None :
-                        line = view.line(position)
-                        before = view.substr(sublime.Region(line.begin(), position))
-                        after = view.substr(sublime.Region(position, line.end()))
-                        # Between {{ and }}
-                        if (re.match(".*{{[^{}]*$", before) != None) and (re.match("^[^{}]*}}.*", after)):
-                            try : 
-                                tagId = COLT.colt_rpc.getEnclosingTagId(view.file_name(), position, getContent(view))["result"]
-                                result = COLT.colt_rpc.angularExpressionCompletion(tagId, re.match(".*{{([^{}]*)$", before).group(1))["result"]
-                            except KeyError :
-                                pass
-                        else :
-                            # Between <...=" and "
-                            if (re.match(".*<[^>]+=\"[^\"]*$", before) != None) and (re.match("^[^\"]*\".*", after)):
-                                try : 
-                                    tagId = COLT.colt_rpc.getEnclosingTagId(view.file_name(), position, getContent(view))["result"]
-                                    result = COLT.colt_rpc.angularExpressionCompletion(tagId, re.match(".*<[^>]+=\"([^\"]*)$", before).group(1))["result"]
-                                except KeyError :
-                                    pass
-                        
-                else :
-                    result = json.loads(result)
+                key = getCompletionKey(view, content, line, before, requestVars)
+                cached = ColtCompletitions.cache.get(key)
+                if not cached is None :
+                        return makeCompletions(filterCompletions(cached, prefix))
+
+                request = ColtCompletitions.pending.get(view.id())
+                if not request is None :
+                        if request.key == key :
+                                # same receiver, just a longer prefix - keep waiting for the request in flight
+                                return ([], sublime.INHIBIT_WORD_COMPLETIONS)
+
+                        # superseded by this keystroke
+                        request.future.cancel()
+
+                prefetching = ColtCompletitions.prefetching
+                if not prefetching is None :
+                        (viewId, request) = prefetching
+                        if viewId == view.id() and request.key == key :
+                                # the idle prefetch is already asking for exactly this; show its answer. It is
+                                # no longer speculative, so the next idle prefetch must not cancel it
+                                request.deadline = time.time() + getCompletionDeadline() / 1000.0
+                                ColtCompletitions.pending[view.id()] = request
+                                ColtCompletitions.prefetching = None
+                                return ([], sublime.INHIBIT_WORD_COMPLETIONS)
+
+                        ColtCompletitions.cancelPrefetch()
+
+                request = PendingCompletion(key, time.time() + getCompletionDeadline() / 1000.0)
+                ColtCompletitions.pending[view.id()] = request
+                request.future = COLT.colt_rpc.runAsync(fetchCompletions, view.file_name(), position, content, requestVars, before, after,
+                        callback = functools.partial(ColtCompletitions.onCompletions, view, request),
+                        errorCallback = functools.partial(ColtCompletitions.onCompletionsFailed, view, request),
+                        trigger = "completion")
+
+                # never hold the keystroke; the popup is re-triggered once COLT answers
+                return ([], sublime.INHIBIT_WORD_COMPLETIONS)
+
+        # after the idle pause, fetch the properties of the identifier left of the cursor as if a dot
+        # had been typed there, so the first dot-completion comes from the cache
+        @staticmethod
+        def prefetch(view):
+                ColtCompletitions.cancelPrefetch()
+
+                if not coltSettings.completionPrefetch :
+                        return
+
+                if not isColtFile(view) or not isConnected() or not hasActiveSessions() :
+                        return
+
+                if len(view.sel()) != 1 or not view.sel()[0].empty() or view.id() in ColtCompletitions.pending :
+                        return
+
+                # the features are known once anything went to COLT; never ask for them from here
+                features = getConnection().features
+                if view.size() > ColtCompletitions.prefetchMaxContent and (features is None or not "contentDelta" in features) :
+                        return
+
+                position = getPositionEnd(view)
+                line = view.line(position)
+                before = view.substr(sublime.Region(line.begin(), position))
+                after = view.substr(sublime.Region(position, line.end()))
+
+                identifier = re.search("[\\w$]+$", before)
+                if identifier is None or identifier.group(0)[0].isdigit() or identifier.group(0) in prefetchSkipWords or after.startswith(".") :
+                        return
+
+                text = view.substr(sublime.Region(0, view.size()))
+                content = text[:position] + "." + text[position:]
+
+                key = getCompletionKey(view, content, sublime.Region(line.begin(), line.end() + 1), before, False)
+                if key in ColtCompletitions.cache or key in ColtCompletitions.prefetched :
+                        # COLT has nothing for an identifier it did not resolve before, either
+                        return
+
+                ColtCompletitions.prefetched.put(key, True)
+
+                # a deadline in the past: nothing pops up unless a dot-completion adopts the request
+                request = PendingCompletion(key, 0)
+                ColtCompletitions.prefetching = (view.id(), request)
+                request.future = COLT.colt_rpc.runAsync(fetchCompletions, view.file_name(), position, content, False, before, "." + after,
+                        callback = functools.partial(ColtCompletitions.onCompletions, view, request),
+                        errorCallback = functools.partial(ColtCompletitions.onCompletionsFailed, view, request),
+                        trigger = "prefetch")
+
+        @staticmethod
+        def cancelPrefetch(view = None):
+                prefetching = ColtCompletitions.prefetching
+                if prefetching is None or (not view is None and prefetching[0] != view.id()) :
+                        return
+
+                prefetching[1].future.cancel()
+                ColtCompletitions.prefetching = None
+
+        @staticmethod
+        def onCompletions(view, request, result):
+                if not ColtCompletitions.prefetching is None and ColtCompletitions.prefetching[1] is request :
+                        ColtCompletitions.prefetching = None
 
-                completitions = []
                 if not result is None :
-                        for resultStr in result :
-                                if "{})" in resultStr :
-                                        resultStr = resultStr.replace("{})", "")
+                        ColtCompletitions.cache.put(request.key, result)
 
-                                replaceStr = resultStr
-                                displayStr = resultStr
-                                cursiveStr = ""
+                if ColtCompletitions.pending.get(view.id()) is not request :
+                        # a newer keystroke wants something else
+                        return
 
-                                if "(" in resultStr :
-                                        replaceStr = resultStr[:resultStr.index("(")]
-                                        displayStr = replaceStr
-                                        cursiveStr = resultStr
+                del ColtCompletitions.pending[view.id()]
 
-                                if cursiveStr != "" :
-                                        displayStr = cursiveStr
-                                        cursiveStr = ""
-                                completitions.append((displayStr + "\t" + cursiveStr + "[COLT]", replaceStr.replace('$', '\$')))
+                if result is None or time.time() > request.deadline :
+                        return
+
+                if view.window() is None or view.window().active_view() != view :
+                        return
 
-                return completitions
+                view.run_command("hide_auto_complete")
+                view.run_command("auto_complete", {
+                        "disable_auto_insert": True,
+                        "api_completions_only": True,
+                        "next_completion_if_showing": False })
+
+        @staticmethod
+        def onCompletionsFailed(view, request, error):
+                if not ColtCompletitions.prefetching is None and ColtCompletitions.prefetching[1] is request :
+                        ColtCompletitions.prefetching = None
+
+                if ColtCompletitions.pending.get(view.id()) is request :
+                        del ColtCompletitions.pending[view.id()]
+
+class PendingCompletion(object):
+        def __init__(self, key, deadline):
+                self.key = key
+                self.deadline = deadline
+                self.future = None
 
 class AbstractColtRunCommand(sublime_plugin.WindowCommand):
         runArg = None
@@ -142,14 +342,12 @@ class AbstractColtRunCommand(sublime_plugin.WindowCommand):
                 return
 
         def getSettings(self):
-                settings = sublime.load_settings(ColtPreferences.NAME)
-                if not settings.has("coltPath") :                        
+                if coltSettings.coltPath is None :
                         sublime.error_message("COLT path is not specified, please enter the path")
                         self.window.show_input_panel("COLT Path:", "", self.onCOLTPathInput, None, None)
                         return
 
-                settings = sublime.load_settings(ColtPreferences.NAME)
-                coltPath = settings.get("coltPath")
+                coltPath = coltSettings.coltPath
                 
                 if not os.path.exists(coltPath) :
                         sublime.error_message("COLT path specified is invalid, please enter the correct path")
@@ -157,13 +355,11 @@ class AbstractColtRunCommand(sublime_plugin.WindowCommand):
                         return
 
                 # if not here, any colt.runCOLT() call will fail, however plugin can still connect to running COLT
-                return sublime.load_settings(ColtPreferences.NAME)    
+                return coltSettings
 
         def onCOLTPathInput(self, inputPath):
                 if inputPath and os.path.exists(inputPath) :
-                        settings = sublime.load_settings(ColtPreferences.NAME)
-                        settings.set("coltPath", inputPath)
-                        sublime.save_settings(ColtPreferences.NAME)
+                        coltSettings.set("coltPath", inputPath)
                         self.run(self.runArg)
                 else :
                         sublime.error_message("COLT path specified is invalid")   
@@ -173,117 +369,326 @@ class AbstractColtRunCommand(sublime_plugin.WindowCommand):
                         return False
                 return isColtFile(self.window.active_view())
 
+# what the plugin shows for one COLT connection; errors and counts of several projects live side by side
+class ColtSessionState(object):
+        def __init__(self):
+                self.errors = COLT.colt_markers.ErrorRegistry()
+                # the project's latest method counts, drawn together with the other projects' ones
+                self.counts = []
+                self.hadSessions = False
+                self.sessionStartTime = 0.0
+                self.runtimeError = { "message" : "" }
+
+# project path -> ColtSessionState
+sessionStates = {}
+
+# the state of the connection calls on this thread go to, see colt_rpc.getConnection
+def getSessionState():
+        return sessionStates.setdefault(getConnection().projectPath, ColtSessionState())
+
 class GetAllCountsCommand(sublime_plugin.WindowCommand):
-        ranges = []
+        # one renderer for the counts of all projects, which share the region keys
+        markers = COLT.colt_markers.CountMarkers()
     
         def run(self):
-            # but 1st, clear every region this command could have created
-            for p in GetAllCountsCommand.ranges:
-                p[0].erase_regions(p[1])
-                
-            GetAllCountsCommand.ranges = []
-                        
-            if ColtConnection.activeSessions > 0:
-                
+            if hasActiveSessions():
                 # getMethodCounts
                 # {u'jsonrpc': u'2.0', u'id': 77, u'result': [{u'count': 1, u'position': 339, u'filePath': u'/Users/makc/Downloads/d3/bubles.js'}, ...
-                resultJSON = COLT.colt_rpc.getMethodCounts()
-                
-                if ("error" in resultJSON) or resultJSON["result"] is None :
-                        # sublime.error_message("Can't read method counts")
-                        return
-                        
-                for info in resultJSON["result"]:
+                COLT.colt_rpc.runAsync(COLT.colt_rpc.getMethodCounts, callback = self.onCounts)
+            else :
+                GetAllCountsCommand.showCounts(None)
+
+        def onCounts(self, resultJSON):
+            GetAllCountsCommand.showCounts(resultJSON)
+
+        @staticmethod
+        def onCountsEvent(event):
+            GetAllCountsCommand.showCounts({ "result" : event["counts"] })
+
+        # keeps the counts of this thread's connection and redraws those of all projects
+        @staticmethod
+        def showCounts(resultJSON):
+            state = getSessionState()
+            if not hasActiveSessions() or resultJSON is None :
+                state.counts = []
+            elif ("error" in resultJSON) or resultJSON["result"] is None :
+                # sublime.error_message("Can't read method counts")
+                state.counts = []
+            else :
+                state.counts = resultJSON["result"]
+
+            states = list(sessionStates.values())
+            counts = []
+            for sessionState in states :
+                counts.extend(sessionState.counts)
+
+            if len(counts) == 0 :
+                GetAllCountsCommand.markers.clear()
+                return
 
-                    position = info["position"]
-                    filePath = info["filePath"]
-                                        
-                    count = info["count"]
-                    
-                    if count > 0:
-                        if count > 9:
-                            count = "infinity"
-                    
-                        for view in self.window.views():
-                            if view.file_name() == filePath:
-                                
-                                # do not show count if there is an error in this line
-                                noError = True
-                                row = view.rowcol( position )[0]
-                                for p in IdleWatcher.ranges:
-                                    if p[4] == view.file_name() :
-                                        if (row == view.rowcol( p[2] )[0]) :
-                                            noError = False
-                                
-                                if noError :
-                                    view.add_regions("counts." + str(position), [sublime.Region(position)],
-                                        "scope", "Packages/COLT/icons/" + str(count) + "@2x.png", sublime.HIDDEN)
-                                    GetAllCountsCommand.ranges.append([view, "counts." + str(position)])
+            def getErrorRows(view):
+                rows = set()
+                for sessionState in states :
+                    rows.update(sessionState.errors.getRows(view.file_name()) or [])
+                return rows
+
+            GetAllCountsCommand.markers.render(sublime.windows(), counts, getErrorRows)
                     
 
 class ColtShowLastErrorsCommand(sublime_plugin.WindowCommand):
 
+    shownErrors = []
+
     def run(self):
+        self.shownErrors = list(getSessionState().errors)
         items = []
-        for p in IdleWatcher.ranges:
-            items.append([p[3], "\tat " + p[4]])
+        for error in self.shownErrors:
+            items.append([error.message, "\tat " + error.filePath])
         self.window.show_quick_panel(items, self.on_done, 0, 0, self.on_done)
 
     def on_done(self, picked):
         if picked == -1:
             return
-        if picked >= len(IdleWatcher.ranges):
+        if picked >= len(self.shownErrors):
             return
-        p = IdleWatcher.ranges[picked]
-        self.window.open_file( p[4] + ":" + str(p[5]), sublime.ENCODED_POSITION )
+        error = self.shownErrors[picked]
+        self.window.open_file( error.filePath + ":" + str(error.row), sublime.ENCODED_POSITION )
         
     def is_enabled(self):
         return isConnected() and hasActiveSessions()
 
 
+# calls onIdle(view) once a view has seen no activity for delay ms, or at the latest maxLatency ms
+# after the first activity of a burst. Keeps at most one pending timeout per view: activity only
+# moves the deadline, and the timeout re-arms itself for the rest
+class IdleDebouncer(object):
+    def __init__(self, delay, onIdle, maxLatency = None):
+        self.delay = delay
+        self.maxLatency = maxLatency
+        self.onIdle = onIdle
+        # view id -> [ time the view becomes idle, time the burst must be flushed by ]
+        self.deadlines = {}
+
+    def touch(self, view):
+        now = time.time()
+        deadline = self.deadlines.get(view.id())
+        if deadline is None :
+            latest = None
+            if not self.maxLatency is None :
+                latest = now + self.maxLatency / 1000.0
+            self.deadlines[view.id()] = [ now + self.delay / 1000.0, latest ]
+            sublime.set_timeout(functools.partial(self.check, view), self.delay)
+        else :
+            deadline[0] = now + self.delay / 1000.0
+
+    def cancel(self, view):
+        self.deadlines.pop(view.id(), None)
+
+    def check(self, view):
+        deadline = self.deadlines.get(view.id())
+        if deadline is None :
+            return
+
+        due = deadline[0]
+        if not deadline[1] is None :
+            due = min(due, deadline[1])
+
+        remaining = int((due - time.time()) * 1000)
+        if remaining > 0 :
+            sublime.set_timeout(functools.partial(self.check, view), remaining)
+            return
+
+        del self.deadlines[view.id()]
+        self.onIdle(view)
+
+def getLogPanel(window):
+        outputPanel = window.find_output_panel("COLT_LOG")
+        if outputPanel is None :
+                outputPanel = window.create_output_panel("COLT_LOG")
+                outputPanel.set_scratch(True)
+                outputPanel.set_read_only(True)
+                outputPanel.set_name("COLT_LOG")
+        return outputPanel
+
+# appends what came in since the last refresh in one edit
+def showLogPanel(window, reveal):
+        log = IdleWatcher.log
+        log.setCapacity(coltSettings.logCapacity)
+
+        entries = log.takePending()
+        if len(entries) > 0 :
+                text = "\n".join(entry.format() for entry in entries) + "\n"
+                getLogPanel(window).run_command("colt_log_write", {"text": text, "maxLines": log.entries.maxlen})
+
+        if reveal :
+                window.run_command("show_panel", {"panel": "output.COLT_LOG", "toggle": False})
+
+class ColtLogWriteCommand(sublime_plugin.TextCommand):
+        def run(self, edit, text, maxLines, replace = False):
+                self.view.set_read_only(False)
+                if replace :
+                        self.view.replace(edit, sublime.Region(0, self.view.size()), text)
+                else :
+                        self.view.insert(edit, self.view.size(), text)
+
+                # drop the oldest lines beyond capacity
+                lines = self.view.rowcol(self.view.size())[0]
+                if lines > maxLines :
+                        self.view.erase(edit, sublime.Region(0, self.view.text_point(lines - maxLines, 0)))
+
+                self.view.set_read_only(True)
+                self.view.show(self.view.size())
+
+# re-renders the panel from the buffer, no need to ask COLT again
+class ColtFilterLogCommand(sublime_plugin.WindowCommand):
+        def run(self):
+                log = IdleWatcher.log
+                self.filters = [ (None, None) ]
+                items = [ "All messages" ]
+                for level in log.getLevels() :
+                        self.filters.append((level, None))
+                        items.append("Level: " + level)
+                for source in log.getSources() :
+                        self.filters.append((None, source))
+                        items.append("Source: " + source)
+                self.window.show_quick_panel(items, self.on_done)
+
+        def on_done(self, picked):
+                if picked == -1 :
+                        return
+
+                log = IdleWatcher.log
+                (level, source) = self.filters[picked]
+                log.setFilter(level, source)
+
+                text = "".join(entry.format() + "\n" for entry in log.getFiltered())
+                getLogPanel(self.window).run_command("colt_log_write", {"text": text, "maxLines": log.entries.maxlen, "replace": True})
+                self.window.run_command("show_panel", {"panel": "output.COLT_LOG", "toggle": False})
+
+class ColtShowRpcStatisticsCommand(sublime_plugin.WindowCommand):
+        def run(self, reset = False):
+                if reset :
+                        COLT.colt_rpc.rpcStats.reset()
+
+                outputPanel = self.window.find_output_panel("COLT_RPC_STATS")
+                if outputPanel is None :
+                        outputPanel = self.window.create_output_panel("COLT_RPC_STATS")
+                        outputPanel.set_scratch(True)
+                        outputPanel.set_read_only(True)
+                        outputPanel.set_name("COLT_RPC_STATS")
+
+                text = COLT.colt_rpc.rpcStats.report() + "\n"
+                outputPanel.run_command("colt_log_write", {"text": text, "maxLines": text.count("\n") + 1, "replace": True})
+                self.window.run_command("show_panel", {"panel": "output.COLT_RPC_STATS", "toggle": False})
+
+class ColtToggleProfilingCommand(sublime_plugin.WindowCommand):
+        profiler = COLT.colt_profiler.ColtProfiler()
+
+        def run(self):
+                profiler = ColtToggleProfilingCommand.profiler
+                if not profiler.isRunning() :
+                        profiler.start(getProfiledClasses())
+                        sublime.status_message("COLT profiling started")
+                        return
+
+                (text, stats) = profiler.stop()
+                if not stats is None :
+                        profilePath = os.path.join(tempfile.gettempdir(), "colt-" + time.strftime("%Y%m%d-%H%M%S") + ".prof")
+                        stats.dump_stats(profilePath)
+                        text = text + "\nProfile saved to " + profilePath + "\n"
+
+                outputPanel = self.window.find_output_panel("COLT_PROFILE")
+                if outputPanel is None :
+                        outputPanel = self.window.create_output_panel("COLT_PROFILE")
+                        outputPanel.set_scratch(True)
+                        outputPanel.set_read_only(True)
+                        outputPanel.set_name("COLT_PROFILE")
+
+                outputPanel.run_command("colt_log_write", {"text": text, "maxLines": text.count("\n") + 1, "replace": True})
+                self.window.run_command("show_panel", {"panel": "output.COLT_PROFILE", "toggle": False})
+
+        def description(self):
+                if ColtToggleProfilingCommand.profiler.isRunning() :
+                        return "Stop Profiling"
+                return "Start Profiling"
+
+# records the session's RPC traffic for benchmarks/replay_session.py
+class ColtToggleRpcRecordingCommand(sublime_plugin.ApplicationCommand):
+        def run(self):
+                recorder = COLT.colt_rpc.rpcRecorder
+                if not recorder.isRecording() :
+                        try :
+                                recorder.start(os.path.join(tempfile.gettempdir(), "colt-session-" + time.strftime("%Y%m%d-%H%M%S") + ".jsonl.gz"))
+                        except OSError as e :
+                                sublime.error_message("Can't start the COLT RPC recording: " + str(e))
+                                return
+                        sublime.status_message("Recording COLT RPC traffic")
+                        return
+
+                path = recorder.stop()
+                print("COLT: RPC recording saved to " + path)
+                sublime.status_message("COLT RPC recording saved to " + path)
+
+        def description(self):
+                if COLT.colt_rpc.rpcRecorder.isRecording() :
+                        return "Stop Recording RPC"
+                return "Start Recording RPC"
+
+# listeners, commands and helpers defined in this module, minus the profiler toggle itself
+def getProfiledClasses():
+        classes = []
+        for value in list(globals().values()) :
+                if isinstance(value, type) and value.__module__ == __name__ and value != ColtToggleProfilingCommand :
+                        classes.append(value)
+        return classes
+
 # ST3 version of http://www.sublimetext.com/docs/plugin-examples Idle Watcher
 class IdleWatcher(sublime_plugin.EventListener):
-    pending = 0
-    ranges = []
-    sessionStartTime = 0.0
-    runtimeError = { "message" : "" }
+    log = COLT.colt_log.ColtLogBuffer(5000)
+    errorMarkers = COLT.colt_markers.ErrorMarkers()
     
     @staticmethod
-    def clearErrors():
-        for p in IdleWatcher.ranges:
-            if  p[0] != None :
-                p[0].erase_regions(p[1])
+    def makeRuntimeErrorInfo(runtimeError):
+        return {
+            "position" : runtimeError["position"],
+            "row" : runtimeError["row"],
+            "filePath" : runtimeError["filePath"],
+            "message" : runtimeError["errorMessage"] }
 
-        IdleWatcher.ranges = []        
-    
-    def handleTimeout(self, view):
-        self.pending = self.pending - 1
-        if self.pending == 0:
-            # There are no more queued up calls to handleTimeout, so it must have
-            # been 800ms since the last modification
-            self.onIdle(view)
+    @staticmethod
+    def addLogEntry(info):
+        IdleWatcher.log.add(info.get("level", "COLT"), info.get("source"), info["message"])
 
+    @staticmethod
+    def clearErrors():
+        getSessionState().errors.clear()
+        IdleWatcher.showErrors()
+    
     def onModified(self, view):
-        self.pending = self.pending + 1
-        # Ask for handleTimeout to be called in 800ms
-        sublime.set_timeout(functools.partial(self.handleTimeout, view), 800)
+        # nothing to refresh for other files, output panels or without COLT
+        if not isConnected() or not isColtFile(view) :
+            return
+
+        IdleWatcher.debouncer.touch(view)
 
-    def printLogs(self):
-        if ColtConnection.activeSessions > 0:
-            resultJSON = COLT.colt_rpc.getLastLogMessages()
+    @staticmethod
+    # runtimeErrors, when COLT reads them by cursor, holds just the new ones; otherwise the last
+    # runtime error in resultJSON2 is compared with the previous one
+    def printLogs(resultJSON, resultJSON2, runtimeErrors = None):
+        state = getSessionState()
+        if hasActiveSessions() and not resultJSON is None:
             if ("error" in resultJSON) or resultJSON["result"] is None :
                 return
                 
-            resultJSON2 = COLT.colt_rpc.getLastRuntimeError();
-            if not (("error" in resultJSON2) or resultJSON2["result"] is None) :
-                if IdleWatcher.runtimeError["message"] != resultJSON2["result"]["errorMessage"] :
+            if not runtimeErrors is None :
+                for runtimeError in runtimeErrors :
+                    state.runtimeError = IdleWatcher.makeRuntimeErrorInfo(runtimeError)
+                    resultJSON["result"].append(state.runtimeError)
+            elif not (("error" in resultJSON2) or resultJSON2["result"] is None) :
+                if state.runtimeError["message"] != resultJSON2["result"]["errorMessage"] :
                     # new runtime error - add to errors list
-                    IdleWatcher.runtimeError = {
-                        "position" : resultJSON2["result"]["position"],
-                        "row" : resultJSON2["result"]["row"],
-                        "filePath" : resultJSON2["result"]["filePath"],
-                        "message" : resultJSON2["result"]["errorMessage"] }
-                    resultJSON["result"].append(IdleWatcher.runtimeError)
+                    state.runtimeError = IdleWatcher.makeRuntimeErrorInfo(resultJSON2["result"])
+                    resultJSON["result"].append(state.runtimeError)
 
             if len(resultJSON["result"]) > 0 :
                 
@@ -295,14 +700,8 @@ class IdleWatcher(sublime_plugin.EventListener):
                         # syntax error
                         if (len (info["message"]) == 0) :
                             # empty syntax error message signals that corresponding page was reloaded
-                            itemsToRemove = []
-                            for p in IdleWatcher.ranges:
-                                if p[4] == info["filePath"]:
-                                    if  p[0] != None :
-                                        p[0].erase_regions(p[1])
-                                    itemsToRemove.append(p)
-                            for p in itemsToRemove :
-                                IdleWatcher.ranges.remove(p)
+                            COLT.colt_rpc.liveStateChanged()
+                            state.errors.removeFile(info["filePath"])
                                 
                             itemsToRemove = []
                             for pendingError in syntaxErrors :
@@ -313,13 +712,13 @@ class IdleWatcher(sublime_plugin.EventListener):
                         else :
                             # add to the list and print
                             syntaxErrors.append(info)
-                            if time.time() - IdleWatcher.sessionStartTime < 3.0 :
+                            if time.time() - state.sessionStartTime < 3.0 :
                                 # open console on syntax errors during 1st 3 seconds only
                                 openConsole = True
-                            print("[COLT] " + info["message"])
+                            IdleWatcher.addLogEntry(info)
                     else :
                         # just print it
-                        print("[COLT] " + info["message"])
+                        IdleWatcher.addLogEntry(info)
                         #try :
                         #    if info["source"] == "License" :
                         #        openConsole = True
@@ -330,51 +729,85 @@ class IdleWatcher(sublime_plugin.EventListener):
                     
                 # now show syntax errors
                 for info in syntaxErrors :
-                    viewFound = None
-                    for view in sublime.active_window().views():
-                        if view.file_name() == info["filePath"]:
-                            position = info["position"]
-                            view.add_regions("error." + str(position), [sublime.Region(position)],
-                                "scope", "Packages/COLT/icons/error@2x.png", sublime.HIDDEN)
-                            viewFound = view
-                    IdleWatcher.ranges.append([viewFound, "error." + str(info["position"]), info["position"], info["message"], info["filePath"], info["row"]])
+                    state.errors.add(COLT.colt_markers.ColtError(info["filePath"], info["position"], info["row"], info["message"]))
                         
-                if openConsole :
-                    sublime.active_window().run_command("show_panel", {"panel": "console", "toggle": False})
+                showLogPanel(sublime.active_window(), openConsole)
             
-            # also show errors in views opened later
-            for p in IdleWatcher.ranges:
-                if (p[0] == None) or (p[0].window() == None) :
-                    for view in sublime.active_window().views():
-                        if view.file_name() == p[4]:
-                            view.add_regions(p[1], [sublime.Region(p[2])],
-                                "scope", "Packages/COLT/icons/error@2x.png", sublime.HIDDEN)
-                            p[0] = view
+            IdleWatcher.showErrors()
                 
         else :
             # clear all ranges
             IdleWatcher.clearErrors()
+
+    # one error region set per view, for the errors of all connections; also covers views opened later
+    @staticmethod
+    def showErrors():
+        positionsByPath = {}
+        for state in list(sessionStates.values()) :
+            for filePath, positions in state.errors.getPositionsByPath().items() :
+                positionsByPath.setdefault(filePath, []).extend(positions)
+        IdleWatcher.errorMarkers.render(sublime.windows(), positionsByPath)
                 
-    def onIdle(self, view):
+    @staticmethod
+    def onIdle(view):
         #print "No activity in the past 800ms"
-        self.printLogs()
-        sublime.active_window().run_command("get_all_counts")
-        sublime.set_timeout(functools.partial(self.onModified, view), 800)
+        if not isConnected() :
+            return
+
+        # the periodic refresh runs on the scheduler; idleness just makes it come sooner
+        COLT.colt_rpc.scheduler.trigger("refresh")
+
+        ColtCompletitions.prefetch(view)
+        ColtGoToDeclarationCommand.prefetch(view)
+
+    # scheduler job: logs, runtime error, counts and state in one batch, off the UI thread
+    @staticmethod
+    def refresh():
+        connection = getConnection()
+        state = getSessionState()
+        if not hasActiveSessions() :
+            if state.hadSessions :
+                state.hadSessions = False
+                sublime.set_timeout(lambda: COLT.colt_rpc.runWithConnection(connection, IdleWatcher.applyRefreshState, None), 0)
+            return False
+
+        state.hadSessions = True
+
+        if connection.eventSubscription.isActive() :
+            # COLT pushes logs, errors and counts
+            sublime.set_timeout(IdleWatcher.showErrors, 0)
+            return False
+
+        refreshState = COLT.colt_rpc.getRefreshState()
+        sublime.set_timeout(lambda: COLT.colt_rpc.runWithConnection(connection, IdleWatcher.applyRefreshState, refreshState), 0)
+
+    @staticmethod
+    def applyRefreshState(refreshState):
+        if refreshState is None :
+            IdleWatcher.printLogs(None, None)
+            GetAllCountsCommand.showCounts(None)
+        else :
+            IdleWatcher.printLogs(refreshState["logMessages"], refreshState["runtimeError"], refreshState["runtimeErrors"])
+            GetAllCountsCommand.showCounts(refreshState["methodCounts"])
 
     def on_modified(self, view):
         self.onModified(view)
 
     def on_selection_modified(self, view):
         self.onModified(view)
+
+        if not isColtFile(view) :
+            return
         
         # check selection for errors
         row = view.rowcol( view.sel()[0].begin() )[0]
         
         message = ""
-        for p in IdleWatcher.ranges:
-            if p[4] == view.file_name() :
-                if (row == view.rowcol( p[2] )[0]) :
-                    message = p[3]
+        errors = []
+        for state in list(sessionStates.values()) :
+            errors.extend(state.errors.getErrorsAt(view.file_name(), row))
+        if errors :
+            message = errors[-1].message
                     
         # todo function signatures ??
         
@@ -383,8 +816,39 @@ class IdleWatcher(sublime_plugin.EventListener):
             view.set_status("colt_error", message)
     
     def on_activated(self, view):
+        COLT.colt_rpc.scheduler.setFocused(True)
         self.onModified(view)
 
+    def on_deactivated(self, view):
+        # followed right away by on_activated when focus just moves to another view
+        COLT.colt_rpc.scheduler.setFocused(False)
+
+    def on_close(self, view):
+        IdleWatcher.debouncer.cancel(view)
+        ColtCompletitions.cancelPrefetch(view)
+
+    # pushed events, see colt_rpc.ColtEventSubscription
+    @staticmethod
+    def onSessionsEvent(event):
+        if not hasActiveSessions() :
+            IdleWatcher.applyRefreshState(None)
+
+    @staticmethod
+    def onLogEvent(event):
+        IdleWatcher.printLogs({ "result" : event["messages"] }, { "result" : None })
+
+    @staticmethod
+    def onRuntimeErrorEvent(event):
+        # every pushed error is new, even one that repeats the last message
+        IdleWatcher.printLogs({ "result" : [] }, { "result" : None }, [ event["error"] ])
+
+IdleWatcher.debouncer = IdleDebouncer(800, IdleWatcher.onIdle)
+ColtAutosaveListener.debouncer = IdleDebouncer(300, ColtAutosaveListener.flush, 2000)
+COLT.colt_rpc.scheduler.schedule("refresh", IdleWatcher.refresh, 0.8, requiresConnection = True)
+COLT.colt_rpc.ColtEventSubscription.addListener("sessions", IdleWatcher.onSessionsEvent)
+COLT.colt_rpc.ColtEventSubscription.addListener("log", IdleWatcher.onLogEvent)
+COLT.colt_rpc.ColtEventSubscription.addListener("runtimeError", IdleWatcher.onRuntimeErrorEvent)
+COLT.colt_rpc.ColtEventSubscription.addListener("counts", GetAllCountsCommand.onCountsEvent)
                 
 class ColtReloadScriptCommand(sublime_plugin.WindowCommand):
 
@@ -395,7 +859,7 @@ class ColtReloadScriptCommand(sublime_plugin.WindowCommand):
                 position = getWordPosition(view)
                 content = getContent(view)
 
-                resultJSON = COLT.colt_rpc.reloadScriptAt(fileName, position, content)
+                COLT.colt_rpc.runAsync(COLT.colt_rpc.reloadScriptAt, fileName, position, content)
 
         def is_enabled(self):
                 view = self.window.active_view()
@@ -403,7 +867,60 @@ class ColtReloadScriptCommand(sublime_plugin.WindowCommand):
                         return False
                 return isColtFile(view) and isConnected() and hasActiveSessions()
 
+# found declarations per file, keyed by the (begin, end, word) span looked up. The entries belong
+# to the text they were found in: once the text changes, spans at or after the first changed
+# character are dropped and the ones before it are kept.
+class DeclarationCache(object):
+        # a prefetched span COLT had no declaration for; kept only while the text is unchanged
+        miss = { "result" : None }
+
+        def __init__(self, maxFiles = 16, maxEntries = 1000):
+                self.maxEntries = maxEntries
+                # file path -> (port, text, { span : result })
+                self.files = COLT.colt_cache.LRUCache(maxFiles)
+
+        def sync(self, filePath, text):
+                cached = self.files.get(filePath)
+                if cached is None or cached[0] != getConnection().port :
+                        entries = {}
+                else :
+                        (port, cachedText, entries) = cached
+                        sameVersion = not text.changeCount is None and text.changeCount == cachedText.changeCount
+                        if not sameVersion and cachedText != text :
+                                editStart = COLT.colt_rpc.commonPrefixLength(cachedText, text, min(len(cachedText), len(text)))
+                                editRow = cachedText.count("\n", 0, editStart) + 1
+                                entries = dict((span, result) for (span, result) in entries.items()
+                                        if span[1] < editStart and not result is DeclarationCache.miss
+                                        and not DeclarationCache.isMovedBy(result, filePath, editRow))
+
+                self.files.put(filePath, (getConnection().port, text, entries))
+                return entries
+
+        # a declaration in the edited file at or below the edited row may have moved to another row
+        @staticmethod
+        def isMovedBy(resultJSON, filePath, editRow):
+                result = resultJSON["result"]
+                return result["filePath"] == filePath and (result.get("optionalRow") or 0) >= editRow
+
+        def get(self, filePath, text, span):
+                return self.sync(filePath, text).get(span)
+
+        def put(self, filePath, text, span, result):
+                entries = self.sync(filePath, text)
+                if len(entries) >= self.maxEntries :
+                        entries.clear()
+                entries[span] = result
+
+def getWordSpan(view, word):
+        return (word.begin(), word.end(), view.substr(word))
+
 class ColtGoToDeclarationCommand(sublime_plugin.WindowCommand):
+        declarations = DeclarationCache()
+        # lookups per idle prefetch, nearest to the cursor first
+        prefetchLimit = 40
+        # without content deltas every lookup in the batch carries the buffer; skip big ones
+        prefetchMaxContent = 65536
+        prefetchFuture = None
 
         def run(self):
                 view = self.window.active_view()
@@ -411,16 +928,93 @@ class ColtGoToDeclarationCommand(sublime_plugin.WindowCommand):
                 fileName = view.file_name()
                 position = getWordPosition(view)
                 content = getContent(view)
+                span = getWordSpan(view, view.word(getPosition(view)))
 
+                cached = ColtGoToDeclarationCommand.declarations.get(fileName, content, span)
+                # a prefetch miss only saves the next prefetch; the angular lookup below may still find it
+                if not cached is None and not cached is DeclarationCache.miss :
+                        self.onDeclaration(cached)
+                        return
+
+                COLT.colt_rpc.runAsync(self.findDeclaration, fileName, position, content,
+                        callback = functools.partial(self.onFound, fileName, content, span))
+
+        # runs on the RPC worker pool
+        def findDeclaration(self, fileName, position, content):
                 resultJSON = COLT.colt_rpc.getDeclarationPosition(fileName, position, content)
                 if "error" in resultJSON or resultJSON["result"] is None :
-                    if re.match("\\.js$", view.file_name()) == None :
+                    if re.match("\\.js$", fileName) == None :
                         # try angular declaration feature instead
-                        resultJSON = colt_rpc.angularDirectiveDeclaration(fileName, position, content)
+                        resultJSON = COLT.colt_rpc.angularDirectiveDeclaration(fileName, position, content)
                         
-                        if resultJSON.has_key("error") or resultJSON["result"] is None :
-                            return
+                        if "error" in resultJSON or resultJSON["result"] is None :
+                            return None
                     else :
+                        return None
+
+                return resultJSON
+
+        def onFound(self, fileName, content, span, resultJSON):
+                if not resultJSON is None :
+                        ColtGoToDeclarationCommand.declarations.put(fileName, content, span, resultJSON)
+                self.onDeclaration(resultJSON)
+
+        # with the "declarationPrefetch" setting, looks up the identifiers in the visible region
+        # that are not cached yet in one batch, so going to their declarations needs no RPC
+        @staticmethod
+        def prefetch(view):
+                if not coltSettings.declarationPrefetch :
+                        return
+
+                if not isColtFile(view) or not isConnected() or not hasActiveSessions() :
+                        return
+
+                future = ColtGoToDeclarationCommand.prefetchFuture
+                if not future is None and not future.done() :
+                        return
+
+                fileName = view.file_name()
+                content = getContent(view)
+                declarations = ColtGoToDeclarationCommand.declarations
+                entries = declarations.sync(fileName, content)
+
+                visible = view.visible_region()
+                spans = []
+                for match in re.finditer("[A-Za-z_$][\\w$]*", content[visible.begin():visible.end()]) :
+                        span = (visible.begin() + match.start(), visible.begin() + match.end(), match.group(0))
+                        if not span in entries and not span[2] in declarationSkipWords :
+                                spans.append(span)
+
+                if len(spans) == 0 :
+                        return
+
+                cursor = getPositionEnd(view)
+                spans.sort(key = lambda span: abs(span[0] - cursor))
+                spans = spans[:ColtGoToDeclarationCommand.prefetchLimit]
+
+                ColtGoToDeclarationCommand.prefetchFuture = COLT.colt_rpc.runAsync(ColtGoToDeclarationCommand.prefetchDeclarations,
+                        fileName, [ span[1] for span in spans ], content,
+                        callback = functools.partial(ColtGoToDeclarationCommand.onPrefetched, fileName, content, spans),
+                        trigger = "prefetch")
+
+        # runs on the RPC worker pool
+        @staticmethod
+        def prefetchDeclarations(fileName, positions, content):
+                if len(content) > ColtGoToDeclarationCommand.prefetchMaxContent and not COLT.colt_rpc.hasFeature("contentDelta") :
+                        return []
+
+                return COLT.colt_rpc.getDeclarationPositions(fileName, positions, content)
+
+        @staticmethod
+        def onPrefetched(fileName, content, spans, responses):
+                declarations = ColtGoToDeclarationCommand.declarations
+                for (span, resultJSON) in zip(spans, responses) :
+                        if "error" in resultJSON or resultJSON["result"] is None :
+                                resultJSON = DeclarationCache.miss
+                        declarations.put(fileName, content, span, resultJSON)
+
+        def onDeclaration(self, resultJSON):
+                if resultJSON is None :
                         return
 
                 row = resultJSON["result"]["optionalRow"]
@@ -443,16 +1037,25 @@ class ColtRunFunctionCommand(sublime_plugin.WindowCommand):
                 position = getWordPosition(view)
                 content = getContent(view)
                 
+                COLT.colt_rpc.runAsync(self.runFunction, fileName, position, content, callback = self.onFunctionRun)
+
+        # runs on the RPC worker pool
+        def runFunction(self, fileName, position, content):
                 methodId = COLT.colt_rpc.getMethodId(fileName, position, content)
 
                 if methodId is None :
-                        sublime.error_message("Can't figure out the function ID")
-                        return
+                        return False
 
                 if methodId.startswith('"') :
                         methodId = methodId[1:len(methodId)-1]
 
                 COLT.colt_rpc.runMethod(methodId)
+                return True
+
+        def onFunctionRun(self, success):
+                if not success :
+                        sublime.error_message("Can't figure out the function ID")
+                        return
                 
                 self.window.run_command("get_all_counts")
         
@@ -464,8 +1067,9 @@ class ColtRunFunctionCommand(sublime_plugin.WindowCommand):
         
 class ColtResetCallCountsCommand(sublime_plugin.WindowCommand):
         def run(self):
-                COLT.colt_rpc.resetCallCounts()
+                COLT.colt_rpc.runAsync(COLT.colt_rpc.resetCallCounts, callback = self.onReset)
 
+        def onReset(self, resultJSON):
                 self.window.run_command("get_all_counts")
 
         def is_enabled(self):
@@ -486,12 +1090,11 @@ class ColtViewCallCountCommand(sublime_plugin.WindowCommand):
                 self.window.set_view_index(outputPanel, 1, 0)
                 
                 position = getWordPosition(view)
-                resultJSON = COLT.colt_rpc.getCallCount(view.file_name(), position, getContent(view))
+                COLT.colt_rpc.runAsync(COLT.colt_rpc.getCallCount, view.file_name(), position, getContent(view),
+                        callback = functools.partial(self.onCallCount, outputPanel))
 
+        def onCallCount(self, outputPanel, resultJSON):
                 if "result" in resultJSON :
-                        position = getPosition(view)
-                        word = view.word(position)
-
                         result = resultJSON["result"]
                         if result is None :
                                 outputPanel.run_command("append_to_console", {"text": "Call count is not available"})
@@ -529,14 +1132,15 @@ class ColtViewValueCommand(sublime_plugin.WindowCommand):
                     if expression is None :
                         expression = view.substr(sel)
                 
-                resultJSON = COLT.colt_rpc.evaluateExpression(view.file_name(), expression, position, getContent(view))
-                if "result" in resultJSON :
-                        position = getPosition(view)
-                        word = view.word(position)
+                word = view.substr(view.word(getPosition(view)))
+                COLT.colt_rpc.runAsync(COLT.colt_rpc.evaluateExpression, view.file_name(), expression, position, getContent(view),
+                        callback = functools.partial(self.onValue, outputPanel, word))
 
+        def onValue(self, outputPanel, word, resultJSON):
+                if "result" in resultJSON :
                         result = resultJSON["result"]
                         if result is None :
-                                outputPanel.run_command("append_to_console", {"text": view.substr(word) + " value: unknown"})
+                                outputPanel.run_command("append_to_console", {"text": word + " value: unknown"})
                         else :
                                 outputPanel.run_command("append_to_console", {"text": result})
 
@@ -549,7 +1153,7 @@ class ColtViewValueCommand(sublime_plugin.WindowCommand):
 class ColtReloadCommand(sublime_plugin.WindowCommand):
         def run(self):
                 IdleWatcher.clearErrors()
-                COLT.colt_rpc.reload()
+                COLT.colt_rpc.runAsync(COLT.colt_rpc.reload)
 
         def is_enabled(self):
                 view = self.window.active_view()
@@ -558,7 +1162,7 @@ class ColtReloadCommand(sublime_plugin.WindowCommand):
                 return isConnected() and hasActiveSessions()
 class ColtClearLogCommand(sublime_plugin.WindowCommand):
         def run(self):
-                COLT.colt_rpc.clearLog()
+                COLT.colt_rpc.runAsync(COLT.colt_rpc.clearLog)
 
         def is_enabled(self):
                 view = self.window.active_view()
@@ -667,14 +1271,15 @@ class RunWithColtCommand(AbstractColtRunCommand):
                 # Add project to workset file
                 COLT.colt.addToWorkingSet(coltProjectFilePath)
 
-                # Run COLT
-                COLT.colt_rpc.initAndConnect(settings, coltProjectFilePath)
-                
-                IdleWatcher.sessionStartTime = time.time()
+                # Run COLT, connect in the background
+                COLT.colt_rpc.initAndConnect(settings, coltProjectFilePath, self.onConnected, self.window)
+
+        def onConnected(self, port):
+                getSessionState().sessionStartTime = time.time()
 
-                # Authorize
+                # Authorize; obtainAuthToken and startLive wait on COLT, so they run on the worker pool
                 COLT.colt_rpc.runAfterAuthorization = COLT.colt_rpc.startLive
-                COLT.colt_rpc.authorize(self.window)                                                          
+                COLT.colt_rpc.runAsync(COLT.colt_rpc.authorize, self.window)
 
         
 class ColtShowJavadocCommand(sublime_plugin.WindowCommand):
@@ -685,7 +1290,7 @@ class ColtShowJavadocCommand(sublime_plugin.WindowCommand):
                 position = getWordPosition(view)
                 content = getContent(view)
 
-                resultJSON = COLT.colt_rpc.findAndShowJavaDocs(fileName, position, content)
+                COLT.colt_rpc.runAsync(COLT.colt_rpc.findAndShowJavaDocs, fileName, position, content)
 
         def is_enabled(self):
                 view = self.window.active_view()